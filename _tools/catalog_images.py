@@ -1,10 +1,16 @@
 #!/usr/bin/env python3
 """Catalog site images into a SQLite database with dimensions and perceptual hashes."""
 
+import argparse
 import os
-import sqlite3
-import imagehash
-from PIL import Image
+from contextlib import closing
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from imagedb import (FAILURE_COLUMNS, BatchWriter, add_hash_columns, connect, create_failures_table,
+                     create_indexes, failed_before, insert_sql, load_failures)
+from runstats import RunStats
+from imageutil import (HASH_NAMES, VARIANTS, file_digest, fingerprint_variants, image_size,
+                       parse_hash_names, skip_reason)
 
 SITE_ROOT = os.path.join(os.path.dirname(__file__), "..")
 
@@ -71,30 +77,17 @@ def project_name_for(filename):
     return PROJECTS.get(project_id, "")
 
 
-def catalog():
-    db_path = os.path.join(SITE_ROOT, "_tools", "images.db")
-    conn = sqlite3.connect(db_path)
-    conn.execute("DROP TABLE IF EXISTS site_images")
-    conn.execute("""
-        CREATE TABLE site_images (
-            path        TEXT PRIMARY KEY,
-            filename    TEXT,
-            project     TEXT,
-            is_thumb    INTEGER,
-            width       INTEGER,
-            height      INTEGER,
-            phash       TEXT
-        )
-    """)
+def is_thumb_name(filename):
+    return 1 if filename.endswith("t.jpg") or filename.endswith("t.png") else 0
+
 
-    # Scan images/, images/big/, and media/
+def site_image_files():
+    """Yield (path, filename) for every image in images/, images/big/ and media/."""
     dirs = [
         os.path.join(SITE_ROOT, "images"),
         os.path.join(SITE_ROOT, "images", "big"),
         os.path.join(SITE_ROOT, "media"),
     ]
-
-    count = 0
     for d in dirs:
         if not os.path.isdir(d):
             continue
@@ -105,29 +98,106 @@ def catalog():
             ext = os.path.splitext(fname)[1].lower()
             if ext not in (".jpg", ".jpeg", ".png"):
                 continue
+            yield fpath, fname
 
-            try:
-                img = Image.open(fpath)
-                w, h = img.size
-                phash = str(imagehash.phash(img))
-            except Exception as e:
-                print(f"  SKIP {fpath}: {e}")
-                continue
 
-            rel_path = os.path.relpath(fpath, SITE_ROOT)
-            is_thumb = 1 if fname.endswith("t.jpg") or fname.endswith("t.png") else 0
-            project = project_name_for(fname)
+def hash_image(fpath, hashes=("phash",), variants=False):
+    """Decode one image and return (width, height, {hash: int},
+    {variant: {hash: int}}, error, timings); the variants dict is empty unless
+    asked for, and timings holds the decode and hash seconds.
+
+    Runs in pool workers, so failures come back as a (reason, message) error
+    instead of an exception."""
+    timings = {}
+    try:
+        return (*fingerprint_variants(fpath, hashes, tuple(VARIANTS) if variants else (),
+                                      timings=timings), None, timings)
+    except Exception as e:
+        return None, None, None, None, (skip_reason(e), str(e)), timings
+
+
+def hash_images(paths, hashes=("phash",), jobs=1, variants=False):
+    """Yield hash_image() results in the same order as paths."""
+    if jobs <= 1 or len(paths) < 2:
+        yield from map(hash_image, paths, repeat(hashes), repeat(variants))
+        return
+    chunksize = max(1, min(16, len(paths) // (jobs * 4)))
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        yield from pool.map(hash_image, paths, repeat(hashes), repeat(variants), chunksize=chunksize)
+
+
+SITE_COLUMNS = ("path", "filename", "project", "is_thumb", "width", "height",
+                *HASH_NAMES, "size", "mtime", "digest")
+
+VARIANT_COLUMNS = ("path", "transform", *HASH_NAMES)
+
+
+def create_variants_table(conn):
+    """Fingerprints of each site image's VARIANTS, one row per transform."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS site_variants (
+            path        TEXT,
+            transform   TEXT,
+            phash       INTEGER,
+            dhash       INTEGER,
+            whash       INTEGER,
+            colorhash   INTEGER,
+            PRIMARY KEY (path, transform)
+        )
+    """)
+    # Center crops used to be stored here; they are taken of candidates now
+    conn.execute(f"DELETE FROM site_variants WHERE transform NOT IN ({', '.join('?' * len(VARIANTS))})",
+                 tuple(VARIANTS))
+
+
+def create_table(conn):
+    conn.execute("DROP TABLE IF EXISTS site_images")
+    conn.execute("DROP TABLE IF EXISTS site_variants")
+    conn.execute("""
+        CREATE TABLE site_images (
+            path        TEXT PRIMARY KEY,
+            filename    TEXT,
+            project     TEXT,
+            is_thumb    INTEGER,
+            width       INTEGER,
+            height      INTEGER,
+            phash       INTEGER,
+            dhash       INTEGER,
+            whash       INTEGER,
+            colorhash   INTEGER,
+            size        INTEGER,
+            mtime       INTEGER,
+            digest      TEXT
+        )
+    """)
+    create_variants_table(conn)
+    create_failures_table(conn)
+    conn.execute("DELETE FROM scan_failures WHERE source = 'site_images'")
+
+
+def load_existing(conn, hashes=("phash",), variants=False):
+    """Return {path: (size, mtime, digest, complete)} for an incremental run,
+    or None if the table is missing or predates the size/mtime/digest columns.
 
-            conn.execute(
-                "INSERT OR REPLACE INTO site_images VALUES (?, ?, ?, ?, ?, ?, ?)",
-                (rel_path, fname, project, is_thumb, w, h, phash),
-            )
-            count += 1
+    complete is False when any of the requested hashes (or, with variants,
+    the variant rows) is missing.
+    """
+    cols = [row[1] for row in conn.execute("PRAGMA table_info(site_images)")]
+    if "digest" not in cols:
+        return None
+    add_hash_columns(conn, "site_images")
+    create_variants_table(conn)
+    missing = " OR ".join(f"{name} IS NULL" for name in hashes)
+    if variants:
+        missing_variant = " OR ".join(f"v.{name} IS NULL" for name in hashes)
+        missing += (f" OR (SELECT COUNT(*) FROM site_variants v WHERE v.path = site_images.path "
+                    f"AND NOT ({missing_variant})) < {len(VARIANTS)}")
+    rows = conn.execute(f"SELECT path, size, mtime, digest, NOT ({missing}) FROM site_images")
+    return {path: (size, mtime, digest, bool(complete))
+            for path, size, mtime, digest, complete in rows}
 
-    conn.commit()
-    print(f"Cataloged {count} images into {db_path}")
 
-    # Summary
+def print_summary(conn):
     cur = conn.execute("SELECT COUNT(*) FROM site_images WHERE is_thumb = 0")
     full = cur.fetchone()[0]
     cur = conn.execute("SELECT COUNT(*) FROM site_images WHERE is_thumb = 1")
@@ -136,8 +206,182 @@ def catalog():
     projects = cur.fetchone()[0]
     print(f"  {full} full-size, {thumbs} thumbnails, {projects} projects")
 
+
+def catalog_dimensions():
+    """Refresh width/height from image headers only, without decoding or hashing.
+
+    New files get a row with no phash and no size/mtime/digest, so the next
+    --incremental run picks them up for hashing. Files recorded in
+    scan_failures are left out until they change, as --incremental would
+    only remove their rows again.
+    """
+    db_path = os.path.join(SITE_ROOT, "_tools", "images.db")
+    conn = connect(db_path)
+    if not conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'site_images'").fetchone():
+        create_table(conn)
+
+    known = {path for (path,) in conn.execute("SELECT path FROM site_images")}
+    failures = load_failures(conn, "site_images")
+    still_failing = 0
+    updates = BatchWriter(conn, "UPDATE site_images SET width = ?, height = ? WHERE path = ?")
+    inserts = BatchWriter(conn, insert_sql("site_images", SITE_COLUMNS[:6]))
+    with updates, inserts:
+        for fpath, fname in site_image_files():
+            rel_path = os.path.relpath(fpath, SITE_ROOT)
+            if rel_path not in known:
+                st = os.stat(fpath)
+                if failed_before(failures, rel_path, st.st_size, st.st_mtime_ns):
+                    still_failing += 1
+                    continue
+            try:
+                w, h = image_size(fpath)
+            except Exception as e:
+                print(f"  SKIP {fpath}: {e}")
+                continue
+            if rel_path in known:
+                updates.add((w, h, rel_path))
+            else:
+                inserts.add((rel_path, fname, project_name_for(fname), is_thumb_name(fname), w, h))
+    create_indexes(conn, "site_images")
+
+    print(f"Refreshed dimensions for {updates.count} images in {db_path} "
+          f"({inserts.count} added without hashes, {still_failing} still failing)")
+    print_summary(conn)
     conn.close()
 
 
+def catalog(incremental=False, jobs=1, hashes=("phash",), variants=False, progress=None, metrics=None):
+    db_path = os.path.join(SITE_ROOT, "_tools", "images.db")
+    stats = RunStats("catalog_images", progress)
+    stats.workers["jobs"] = jobs
+    conn = connect(db_path)
+
+    existing = load_existing(conn, hashes, variants) if incremental else None
+    if existing is None:
+        if incremental:
+            print("No incremental catalog found, doing a full pass")
+        create_table(conn)
+        existing = {}
+    # Files that failed to decode before are skipped until they change
+    failures = load_failures(conn, "site_images")
+
+    # Work out what needs decoding; only the decode itself is parallel
+    todo = []
+    unchanged = 0
+    still_failing = 0
+    seen = set()
+    present = set()
+    touched = BatchWriter(conn, "UPDATE site_images SET size = ?, mtime = ? WHERE path = ?")
+    with stats.stage("walk"):
+        for fpath, fname in site_image_files():
+            rel_path = os.path.relpath(fpath, SITE_ROOT)
+            st = os.stat(fpath)
+            size, mtime = st.st_size, st.st_mtime_ns
+            present.add(rel_path)
+            prev = existing.get(rel_path)
+            if prev and prev[3] and prev[:2] == (size, mtime):
+                seen.add(rel_path)
+                unchanged += 1
+                continue
+            reason = failed_before(failures, rel_path, size, mtime)
+            if reason:
+                stats.skipped[reason] += 1
+                still_failing += 1
+                continue
+
+            # Touched but identical content: refresh size/mtime, skip the decode
+            with stats.stage("read"):
+                digest = file_digest(fpath)
+            if prev and prev[3] and prev[2] == digest:
+                touched.add((size, mtime, rel_path))
+                seen.add(rel_path)
+                unchanged += 1
+                continue
+
+            todo.append((fpath, rel_path, fname, size, mtime, digest))
+        touched.flush()
+        stats.took("db_write", touched.seconds)
+
+    # Hash (in parallel if asked) and write from this process only, in batches
+    # A re-hashed image's old variant rows are stale either way
+    results = hash_images([item[0] for item in todo], hashes, jobs, variants)
+    rows = BatchWriter(conn, insert_sql("site_images", SITE_COLUMNS, replace=True))
+    variant_rows = BatchWriter(conn, insert_sql("site_variants", VARIANT_COLUMNS, replace=True))
+    stale_variants = BatchWriter(conn, "DELETE FROM site_variants WHERE path = ?")
+    failed = BatchWriter(conn, insert_sql("scan_failures", FAILURE_COLUMNS, replace=True))
+    recovered = BatchWriter(conn, "DELETE FROM scan_failures WHERE source = 'site_images' AND path = ?")
+    stats.total = len(todo)
+    # Closing results shuts the worker pool down before the stats are reported
+    with closing(results), stale_variants, rows, variant_rows, failed, recovered:
+        for (fpath, rel_path, fname, size, mtime, digest), result in zip(todo, results):
+            w, h, fps, vfps, err, timings = result
+            stats.add(timings)
+            if err is not None:
+                reason, message = err
+                print(f"  SKIP {fpath} ({reason}): {message}")
+                failed.add(("site_images", rel_path, size, mtime, reason, message))
+                stats.advance(skipped=reason)
+                continue
+            if rel_path in failures:
+                recovered.add((rel_path,))
+            stats.advance(size)
+
+            rows.add((rel_path, fname, project_name_for(fname), is_thumb_name(fname),
+                      w, h, *(fps.get(name) for name in HASH_NAMES), size, mtime, digest))
+            if not vfps:
+                stale_variants.add((rel_path,))
+            for transform, variant_fps in vfps.items():
+                variant_rows.add((rel_path, transform, *(variant_fps.get(name) for name in HASH_NAMES)))
+            seen.add(rel_path)
+    count = rows.count
+    stats.took("db_write", rows.seconds + variant_rows.seconds + stale_variants.seconds
+               + failed.seconds + recovered.seconds)
+
+    # Drop rows for files that are gone (or no longer decode)
+    removed = [p for p in existing if p not in seen]
+    with stats.stage("db_write"):
+        with conn:
+            conn.executemany("DELETE FROM site_images WHERE path = ?", [(p,) for p in removed])
+            conn.executemany("DELETE FROM site_variants WHERE path = ?", [(p,) for p in removed])
+            conn.executemany("DELETE FROM scan_failures WHERE source = 'site_images' AND path = ?",
+                             [(p,) for p in failures if p not in present])
+        create_indexes(conn, "site_images")
+        create_indexes(conn, "site_variants")
+
+    if incremental:
+        print(f"Cataloged {count} new or changed images into {db_path} "
+              f"({unchanged} unchanged, {still_failing} still failing, {len(removed)} removed)")
+    else:
+        print(f"Cataloged {count} images into {db_path}")
+
+    print_summary(conn)
+    conn.close()
+    stats.report(metrics)
+
+
 if __name__ == "__main__":
-    catalog()
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--incremental", action="store_true",
+                        help="only re-hash new or changed files and prune deleted ones")
+    parser.add_argument("--jobs", "-j", type=int, default=1,
+                        help="worker processes for decoding/hashing (0 = one per core)")
+    parser.add_argument("--hashes", type=parse_hash_names, default=("phash",),
+                        help=f"comma-separated fingerprints to store ({', '.join(HASH_NAMES)}); "
+                             "phash is always included")
+    parser.add_argument("--variants", action="store_true",
+                        help=f"also fingerprint rotated and mirrored versions "
+                             f"({', '.join(VARIANTS)}) for find_bigger.py --variants")
+    parser.add_argument("--progress", type=float, metavar="SECONDS",
+                        help="print a progress line with rates and ETA this often while hashing")
+    parser.add_argument("--metrics", metavar="FILE",
+                        help="write run metrics (stage times, rates, skips, peak RSS) as JSON; - for stdout")
+    parser.add_argument("--dimensions-only", action="store_true",
+                        help="refresh width/height from image headers without hashing")
+    args = parser.parse_args()
+
+    if args.dimensions_only:
+        catalog_dimensions()
+    else:
+        catalog(incremental=args.incremental, jobs=args.jobs or os.cpu_count() or 1,
+                hashes=args.hashes, variants=args.variants, progress=args.progress,
+                metrics=args.metrics)
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""Golden-file check for migrate.convert_php_content().
+
+A plain run converts the PHP pages under convert_fixtures/site (project pages
+with their project ID, against this repo's images/) and lists every page whose
+output is no longer byte-identical to the one recorded in
+convert_fixtures/expected. --site checks every page of the old site against
+golden/ instead; record there before changing the converter, check after:
+
+    python3 check_convert.py --site --record
+    python3 check_convert.py --site
+
+--rev records with the converter from a git revision instead of the working
+tree, for when the change is already committed (--record --rev HEAD~1).
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import types
+import migrate
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+GOLDEN_DIR = os.path.join(TOOLS_DIR, "golden")
+FIXTURES_DIR = os.path.join(TOOLS_DIR, "convert_fixtures")
+FIXTURE_SITE = os.path.join(FIXTURES_DIR, "site")
+FIXTURE_EXPECTED = os.path.join(FIXTURES_DIR, "expected")
+REPO_IMAGES = os.path.join(os.path.dirname(TOOLS_DIR), "images")
+
+
+def php_pages(old_site):
+    """Yield (path relative to old_site, project ID or None) for every PHP page."""
+    for root, dirs, files in os.walk(old_site):
+        dirs.sort()
+        rel_root = os.path.relpath(root, old_site)
+        for fname in sorted(files):
+            if not fname.endswith(".php"):
+                continue
+            project_id = fname[:-4] if rel_root == "projects" and fname != "index.php" else None
+            yield os.path.normpath(os.path.join(rel_root, fname)), project_id
+
+
+def converter_at(rev):
+    """migrate.py as it was at git revision rev."""
+    source = subprocess.run(["git", "show", f"{rev}:_tools/migrate.py"], cwd=TOOLS_DIR,
+                            capture_output=True, text=True, check=True).stdout
+    module = types.ModuleType("migrate_" + rev)
+    module.__file__ = os.path.join(TOOLS_DIR, "migrate.py")
+    exec(compile(source, f"migrate.py at {rev}", "exec"), module.__dict__)
+    return module
+
+
+def use_fixture_site(module):
+    """Point the converter's project list and image lookups at the fixtures."""
+    module.PROJECT_FILES = module.project_files(FIXTURE_SITE)
+    module.ASSETS = module.SiteAssets(REPO_IMAGES, os.path.join(FIXTURE_SITE, "captions"))
+
+
+def first_difference(a, b):
+    return next((i for i, (x, y) in enumerate(zip(a, b)) if x != y), min(len(a), len(b)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--site", action="store_true",
+                        help=f"check every page of {migrate.OLD_SITE} against golden/")
+    parser.add_argument("--record", action="store_true",
+                        help="write the expected outputs instead of checking against them")
+    parser.add_argument("--rev", metavar="REV",
+                        help="with --record, use the converter from this git revision")
+    args = parser.parse_args()
+    if args.rev and not args.record:
+        parser.error("--rev only applies with --record")
+
+    module = converter_at(args.rev) if args.rev else migrate
+    if args.site:
+        old_site, expected_dir = migrate.OLD_SITE, GOLDEN_DIR
+    else:
+        old_site, expected_dir = FIXTURE_SITE, FIXTURE_EXPECTED
+        use_fixture_site(module)
+
+    checked = differ = missing = 0
+    for rel_path, project_id in php_pages(old_site):
+        raw = open(os.path.join(old_site, rel_path), encoding="latin-1").read()
+        html = module.convert_php_content(raw, project_id)
+        expected_path = os.path.join(expected_dir, rel_path + ".html")
+        checked += 1
+        if args.record:
+            os.makedirs(os.path.dirname(expected_path), exist_ok=True)
+            with open(expected_path, "w", encoding="utf-8", newline="") as f:
+                f.write(html)
+            continue
+        if not os.path.exists(expected_path):
+            print(f"  {rel_path}: no expected output")
+            missing += 1
+            continue
+        with open(expected_path, encoding="utf-8", newline="") as f:
+            expected = f.read()
+        if html != expected:
+            i = first_difference(html, expected)
+            print(f"  {rel_path}: differs at character {i}: {expected[i:i + 40]!r} -> {html[i:i + 40]!r}")
+            differ += 1
+
+    if args.record:
+        print(f"Recorded {checked} pages in {expected_dir}")
+    else:
+        print(f"Checked {checked} pages: {checked - differ - missing} identical, "
+              f"{differ} different, {missing} without an expected output")
+        sys.exit(1 if differ or missing else 0)
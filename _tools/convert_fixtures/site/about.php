@@ -0,0 +1,14 @@
+<?PHP INCLUDE("header.php") ?>
+<!-- About -->
+<h1>About</h1>
+<p>We started with <?php echo(projectlink(199001)); ?> and
+<?php echo(projectlink( 199601 , "The Slammer" )); ?>, then
+<?php echo(ProjectLink(200101,"  Castle ")); ?>.</p>
+<p>Earlier work: <a href=/projects/198701.html">Darrows Cottage</a>.</p>
+<?php echo(projectList("WHERE id IN ('199001','199601','200404','999999')")); ?>
+<p>Photos: <a href=/gallery.php?image=19900101>one</a>,
+<a href="/gallery.php?image=19960102">two</a>,
+<a href='http://otlstudio.com/gallery.php?image=19960103'>three</a>.</p>
+<p><a href="team.php">Team</a> <a href=press.php>Press</a> <a href=/mission/plan.php>Plan</a></p>
+<?php echo $x ? "a" : "b"; ?>
+<?php include("footer.php"); ?>
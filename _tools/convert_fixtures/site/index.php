@@ -0,0 +1,17 @@
+<?php include("header.php"); ?>
+<!-- Home -->
+<div id="intro">
+<img src=images/home1.jpg width=400>
+<img src="images/home2.jpg" alt="">
+<img src=/images/19900101.jpg>
+<img src="/images/19960101t.jpg">
+<img src="<?php echo $base ?>images/logo.gif">
+</div>
+<p>See the <a href=/projects.php>projects</a>, our <a href=/mission.php>mission</a>,
+<a href=/about.php>about us</a> or <a href=/journal.php>the journal</a>.
+<a href=/contact.php>Contact</a> us, or <a href="contact.php<?php echo $qs ?>">write</a>.</p>
+<p><a href=/code/>Code</a> and <a href=/mission/generating.php>generating</a>.</p>
+<?php
+  $qs = "&from=home";
+?>
+<?php include ('footer.php') ?>
@@ -0,0 +1,6 @@
+<?php include("../header.php"); ?>
+<!-- Plan -->
+<h2>Plan</h2>
+<img src=images/plan.gif>
+<p>Back to <a href=/mission.php>the mission</a> or <a href="index.php">home</a>.</p>
+<?php include("../footer.php"); ?>
@@ -0,0 +1,10 @@
+<?php include("../header.php"); ?>
+<!-- Law Offices -->
+<?php echo(photoTop(1,2).projectHeading()); ?>
+<p>Offices on the river.</p>
+<?php echo(photoSide(3, 4, 5, 12)); ?>
+<p>More in <a href=/gallery.php?image=19900104>the gallery</a> and <a href=/projects/199601.html">the next one</a>.</p>
+<?php echo photobar(1, 2, 6) ?>
+<?php echo(photoBar("3","4")) ; ?>
+<!-- <?php include("../nav.php"); ?> -->
+<?php include("../footer.php"); ?>
@@ -0,0 +1,13 @@
+<?php include("../header.php"); ?>
+<!-- The Slammer -->
+<?php echo(projectHeading()); ?>
+<?php echo(photoTop( "2" , 3)); ?>
+<p>Part of <?php echo(projectlink(199001, "")); ?>.</p>
+<?php echo(photoSide(7)); ?>
+<?php echo(photoTop(,)); ?>
+<?php
+  // old visitor counter
+  $count = $count + 1;
+?>
+<p><a href=/about.php>About</a> <a href=/contact.php>Contact</a></p>
+<?php include("../footer.php"); ?>
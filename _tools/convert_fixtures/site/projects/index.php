@@ -0,0 +1,6 @@
+<?php include("../header.php"); ?>
+<!-- Projects -->
+<?php echo(projectList("WHERE id IN ('199001','199601')")); ?>
+<p><?php echo(projectlink(199001)); ?>, <?php echo(projectlink(199601)); ?></p>
+<?php echo(photoTop(1)); ?>
+<?php include("../footer.php"); ?>
@@ -1,11 +1,26 @@
 #!/usr/bin/env python3
 """Search candidate folders for larger versions of site images using perceptual hashing."""
 
+import argparse
+import math
 import os
-import sqlite3
+import signal
 import sys
-import imagehash
-from PIL import Image
+import time
+from collections import Counter
+from itertools import groupby
+from concurrent.futures.process import BrokenProcessPool
+from catalog_images import catalog, site_image_files
+from hashfile import HashFile
+from imagedb import (FAILURE_COLUMNS, BatchWriter, add_columns, add_hash_columns, connect, create_indexes,
+                     failed_before, insert_sql, load_failures)
+import numpy as np
+from hashindex import HammingIndex, hamming_block
+from imageutil import CROPS, HASH_NAMES, MEMORY_BUDGET, VARIANTS, hamming, parse_hash_names
+from runstats import RunStats
+from scanpipe import scan
+from verify import RenditionCache, align_score
+from walkfilter import WalkFilter, exclude_dir_patterns, parse_size
 
 SITE_ROOT = os.path.join(os.path.dirname(__file__), "..")
 DB_PATH = os.path.join(os.path.dirname(__file__), "images.db")
@@ -13,86 +28,833 @@ DB_PATH = os.path.join(os.path.dirname(__file__), "images.db")
 # Maximum hamming distance to consider a match
 THRESHOLD = 12
 
+# Site hashes x candidates compared per step by the numpy engine (~8 bytes each)
+BLOCK_CELLS = 4_000_000
 
-def scan_candidates(search_dir, exclude_dirs=None):
-    if exclude_dirs is None:
-        exclude_dirs = []
+# When extra fingerprints were scanned, a phash match must also be within these
+# distances on every fingerprint both sides have (colorhash is only 42 bits)
+HASH_THRESHOLDS = {
+    "dhash": 12,
+    "whash": 12,
+    "colorhash": 8,
+}
+
+
+# Variants whose aspect ratio is the site image's turned on its side
+QUARTER_TURNS = {"rot90", "rot270"}
+
+CANDIDATE_COLUMNS = ("path", "filename", "width", "height", *HASH_NAMES, "size", "mtime", "digest")
+
+VARIANT_COLUMNS = ("path", "transform", *HASH_NAMES)
+
+
+def extra_hashes(names, values):
+    """Map extra fingerprint names to their values, skipping NULL columns."""
+    return {name: v for name, v in zip(names, values) if v is not None}
+
+
+def extra_agree(site_extra, cand_extra):
+    """True if every fingerprint present on both sides is within its threshold."""
+    for name, shash in site_extra.items():
+        chash = cand_extra.get(name)
+        if chash is not None and hamming(shash, chash) > HASH_THRESHOLDS[name]:
+            return False
+    return True
+
+
+def aspect_limit(tolerance):
+    """Largest allowed |log(site aspect) - log(candidate aspect)|, or None to
+    accept any shape. A tolerance of 0.05 lets the ratios differ by 5%."""
+    return None if tolerance is None else math.log1p(tolerance)
+
+
+def log_aspect(width, height):
+    return math.log(width / height)
+
+
+def crop_pixels(width, height, crop):
+    """Pixel count of a candidate's CROPS crop (or of the whole file for None)."""
+    fraction = CROPS[crop] if crop else 1
+    return round(width * fraction) * round(height * fraction)
+
+
+class CandidateList:
+    """Candidate rows (path, width, height, phash, {extra: int}), sorted by
+    pixel count, with the hashes/pixels/aspects arrays the engines work on
+    (the same interface as hashfile.HashFile).
+
+    Built from (path, width, height, phash, {extra: int}, crop) tuples, where
+    crop names one of the file's CROPS: that row holds the crop's
+    fingerprints and pixel count, but the whole file's path and size."""
+
+    def __init__(self, rows):
+        rows = sorted(rows, key=lambda row: (crop_pixels(row[1], row[2], row[5]), row[0], row[5] or ""))
+        self.rows = [row[:5] for row in rows]
+        self.crops = [row[5] for row in rows]
+        self.hashes = np.array([row[3] for row in rows], dtype=np.int64)
+        width = np.array([row[1] for row in rows], dtype=np.int64)
+        height = np.array([row[2] for row in rows], dtype=np.int64)
+        self.pixels = np.array([crop_pixels(row[1], row[2], row[5]) for row in rows], dtype=np.int64)
+        self.aspects = np.log(width / height)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, j):
+        return self.rows[j]
+
+    def crop(self, j):
+        return self.crops[j]
+
+
+def candidate_list(rows, crop_rows, extra, min_pixels=0):
+    """CandidateList of candidates rows (path, width, height, phash, *extra)
+    and crop_rows (path, transform, phash, *extra) of those same files,
+    leaving out crops of min_pixels pixels or fewer."""
+    sizes = {path: (w, h) for path, w, h, *_ in rows}
+    entries = [(path, w, h, phash, extra_hashes(extra, cextra), None) for path, w, h, phash, *cextra in rows]
+    for path, crop, phash, *cextra in crop_rows:
+        if path in sizes and crop_pixels(*sizes[path], crop) > min_pixels:
+            entries.append((path, *sizes[path], phash, extra_hashes(extra, cextra), crop))
+    return CandidateList(entries)
+
+
+# Each engine takes a CandidateList or HashFile. Those are sorted by pixel
+# count, so the candidates larger than a site image are a suffix of the list
+# and smaller ones are never compared. Sites are (hash, pixels, log aspect ratio).
+
+def brute_force_engine(cand_hashes, aspect_tolerance=None):
+    """Compare every site hash against every larger, compatible candidate in turn."""
+    hashes = cand_hashes.hashes.tolist()
+    aspects = cand_hashes.aspects.tolist()
+    limit = aspect_limit(aspect_tolerance)
+
+    def match(sites):
+        for shash, site_pixels, site_aspect in sites:
+            found = []
+            first = int(np.searchsorted(cand_hashes.pixels, site_pixels, side="right"))
+            for j in range(first, len(hashes)):
+                if limit is not None and abs(aspects[j] - site_aspect) > limit:
+                    continue
+                dist = hamming(shash, hashes[j])
+                if dist <= THRESHOLD:
+                    found.append((j, dist))
+            yield found
+    return match
+
+
+def index_engine(cand_hashes, aspect_tolerance=None):
+    """Look site hashes up in a multi-index hash table over the candidates."""
+    limit = aspect_limit(aspect_tolerance)
+    # Bucket hits of the wrong shape are dropped before their distance is computed
+    index = HammingIndex(cand_hashes.hashes.tolist(),
+                         keys=cand_hashes.aspects.tolist() if limit is not None else None)
+
+    def match(sites):
+        for shash, site_pixels, site_aspect in sites:
+            start = int(np.searchsorted(cand_hashes.pixels, site_pixels, side="right"))
+            key_range = None if limit is None else (site_aspect - limit, site_aspect + limit)
+            yield index.search(shash, THRESHOLD, start=start, key_range=key_range)
+    return match
+
+
+class AspectBuckets:
+    """Candidate positions grouped by log aspect ratio into buckets a little
+    wider than limit (so rounding can't put a compatible candidate two
+    buckets away). Every candidate within limit of a site's aspect is in the
+    site's bucket or a neighbouring one, so window() is all it needs to be
+    compared against."""
+
+    def __init__(self, aspects, limit):
+        self.width = limit * 1.000001 + 1e-9
+        self.buckets = np.floor(aspects / self.width).astype(np.int64)
+        self.windows = {}
 
-    conn = sqlite3.connect(DB_PATH)
+    def bucket(self, aspect):
+        return math.floor(aspect / self.width)
 
-    # Create candidates table
-    conn.execute("DROP TABLE IF EXISTS candidates")
+    def window(self, bucket):
+        """Sorted positions of the candidates in bucket and its two neighbours."""
+        positions = self.windows.get(bucket)
+        if positions is None:
+            positions = self.windows[bucket] = np.flatnonzero(np.abs(self.buckets - bucket) <= 1)
+        return positions
+
+
+def numpy_engine(cand_hashes, aspect_tolerance=None):
+    """XOR + popcount each block of site hashes against all larger candidates
+    at once (with aspect_tolerance, only those in nearby AspectBuckets)."""
+    hashes = cand_hashes.hashes.view(np.uint64)
+    pixels = cand_hashes.pixels
+    aspects = cand_hashes.aspects
+    limit = aspect_limit(aspect_tolerance)
+    buckets = AspectBuckets(aspects, limit) if limit is not None else None
+    everyone = np.arange(len(cand_hashes))
+    block = max(1, BLOCK_CELLS // max(1, len(cand_hashes)))
+
+    def compare(chunk, positions):
+        """Found lists for a block of sites against the candidates at the sorted positions."""
+        spixels = np.array([p for _, p, _ in chunk], dtype=np.int64)
+        # Only candidates larger than the smallest site image in the block
+        positions = positions[np.searchsorted(pixels[positions], spixels.min(), side="right"):]
+        shashes = np.array([h for h, _, _ in chunk], dtype=np.int64).view(np.uint64)
+        dists, mask = hamming_block(shashes, hashes[positions], THRESHOLD)
+        mask &= pixels[None, positions] > spixels[:, None]
+        if limit is not None:
+            saspects = np.array([a for _, _, a in chunk])
+            mask &= np.abs(aspects[None, positions] - saspects[:, None]) <= limit
+        return [[(int(positions[j]), int(dists[row, j])) for j in np.flatnonzero(mask[row])]
+                for row in range(len(chunk))]
+
+    def match(sites):
+        for start in range(0, len(sites), block):
+            chunk = sites[start:start + block]
+            if buckets is None:
+                yield from compare(chunk, everyone)
+                continue
+            # Sites in the same bucket share a window; results go back in site order
+            by_bucket = {}
+            for k, site in enumerate(chunk):
+                by_bucket.setdefault(buckets.bucket(site[2]), []).append(k)
+            found = [None] * len(chunk)
+            for bucket, ks in by_bucket.items():
+                for k, f in zip(ks, compare([chunk[k] for k in ks], buckets.window(bucket))):
+                    found[k] = f
+            yield from found
+    return match
+
+
+# Ways to find, for each site image, the larger candidates within THRESHOLD.
+# All of them give the same matches in the same order.
+ENGINES = {
+    "index": index_engine,
+    "numpy": numpy_engine,
+    "brute": brute_force_engine,
+}
+
+
+def merge_variant_matches(group, cand_hashes):
+    """Combine the (query, found) pairs for one site image (the image itself
+    first, then its variants) into sorted [(j, dist, transform)], keeping
+    each candidate file's closest pairing. transform names the site variant
+    or the candidate crop that matched; a variant is never paired with a crop."""
+    best = {}
+    for (_i, transform, _hash, _pixels, _aspect, sextra), found in group:
+        for j, dist in found:
+            crop = cand_hashes.crop(j)
+            if transform and crop or not extra_agree(sextra, cand_hashes[j][4]):
+                continue
+            # Strictly closer only, so the untransformed pair wins ties
+            rank = (dist, bool(transform or crop))
+            path = cand_hashes[j][0]
+            if path not in best or rank < best[path][0]:
+                best[path] = (rank, j, transform or crop)
+    return sorted((j, rank[0], transform) for rank, j, transform in best.values())
+
+
+def load_site_variants(conn, extra_cols):
+    """{site path: [(transform, phash, *extra)]} from catalog_images --variants."""
+    if not conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'site_variants'").fetchone():
+        return {}
+    by_path = {}
+    for path, *row in conn.execute(f"SELECT path, transform, phash{extra_cols} FROM site_variants "
+                                   "WHERE phash IS NOT NULL ORDER BY path, transform"):
+        by_path.setdefault(path, []).append(row)
+    return by_path
+
+
+def rank_matches(renditions, site_path, found, cand_hashes):
+    """Score each (j, dist, transform) in found with verify.align_score() and
+    return [(j, dist, transform, score)], best score first (ties and
+    unreadable files by distance)."""
+    site = renditions.get(site_path)
+    ranked = []
+    for j, dist, transform in found:
+        cand = renditions.get(cand_hashes[j][0])
+        score = None
+        if site is not None and cand is not None:
+            # A crop match is found by align_score()'s own smaller scales
+            score = align_score(VARIANTS[transform](site) if transform in VARIANTS else site, cand)[0]
+        ranked.append((j, dist, transform, score))
+    ranked.sort(key=lambda r: (r[3] is None, -(r[3] or 0), r[1]))
+    return ranked
+
+
+def create_candidates_table(conn):
     conn.execute("""
-        CREATE TABLE candidates (
+        CREATE TABLE IF NOT EXISTS candidates (
             path        TEXT PRIMARY KEY,
             filename    TEXT,
             width       INTEGER,
             height      INTEGER,
-            phash       TEXT
+            phash       INTEGER,
+            dhash       INTEGER,
+            whash       INTEGER,
+            colorhash   INTEGER,
+            size        INTEGER,
+            mtime       INTEGER,
+            digest      TEXT
+        )
+    """)
+    add_hash_columns(conn, "candidates")
+    add_columns(conn, "candidates", {"size": "INTEGER", "mtime": "INTEGER", "digest": "TEXT"})
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS candidate_variants (
+            path        TEXT,
+            transform   TEXT,
+            phash       INTEGER,
+            dhash       INTEGER,
+            whash       INTEGER,
+            colorhash   INTEGER,
+            PRIMARY KEY (path, transform)
         )
     """)
 
-    # Scan candidate directory
-    extensions = {".jpg", ".jpeg", ".png", ".tif", ".tiff"}
-    count = 0
-    skipped = 0
-    for root, dirs, files in os.walk(search_dir):
-        # Skip excluded directories
-        skip = False
-        for ex in exclude_dirs:
-            if root.startswith(ex):
-                skip = True
-                break
-        if skip:
-            continue
 
-        for fname in sorted(files):
+def dir_prefix(search_dir):
+    """SQL condition and parameters selecting candidate rows under search_dir."""
+    prefix = os.path.join(search_dir, "")
+    return "substr(path, 1, ?) = ?", (len(prefix), prefix)
+
+
+def create_checkpoint_tables(conn):
+    """Tables recording an in-progress scan: the files still to hash after the
+    walk, and the rows whose files had vanished (kept until the end for move
+    detection)."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS scan_state (
+            search_dir  TEXT PRIMARY KEY,
+            walked_at   REAL,
+            queued      INTEGER
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS scan_queue (
+            search_dir  TEXT,
+            seq         INTEGER,
+            path        TEXT,
+            size        INTEGER,
+            mtime       INTEGER,
+            filename    TEXT,
+            PRIMARY KEY (search_dir, seq)
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS scan_gone (
+            search_dir  TEXT,
+            path        TEXT
+        )
+    """)
+
+
+def clear_checkpoint(conn, search_dir):
+    for table in ("scan_state", "scan_queue", "scan_gone"):
+        conn.execute(f"DELETE FROM {table} WHERE search_dir = ?", (search_dir,))
+
+
+def save_checkpoint(conn, search_dir, todo, gone):
+    with conn:
+        clear_checkpoint(conn, search_dir)
+        conn.executemany("INSERT INTO scan_queue VALUES (?, ?, ?, ?, ?, ?)",
+                         [(search_dir, seq, *item) for seq, item in enumerate(todo)])
+        conn.executemany("INSERT INTO scan_gone VALUES (?, ?)", [(search_dir, p) for p in gone])
+        conn.execute("INSERT INTO scan_state VALUES (?, ?, ?)", (search_dir, time.time(), len(todo)))
+
+
+def load_checkpoint(conn, search_dir):
+    """Return (todo, gone paths) saved by an unfinished scan, or None."""
+    state = conn.execute("SELECT walked_at FROM scan_state WHERE search_dir = ?", (search_dir,)).fetchone()
+    if state is None:
+        return None
+    todo = conn.execute("SELECT path, size, mtime, filename FROM scan_queue "
+                        "WHERE search_dir = ? ORDER BY seq", (search_dir,)).fetchall()
+    gone = [p for (p,) in conn.execute("SELECT path FROM scan_gone WHERE search_dir = ?", (search_dir,))]
+    return todo, gone
+
+
+def snapshot_candidates(search_dir, walk_filter):
+    """Walk search_dir and return (files, skipped, errors): files maps each
+    candidate path to (size, mtime, filename) in walk order, skipped is a
+    Counter of reasons and errors counts directories that couldn't be listed."""
+    extensions = {".jpg", ".jpeg", ".png", ".tif", ".tiff"}
+    files = {}
+    skipped = Counter()
+    errors = []
+    for root, fnames in walk_filter.walk(search_dir, onerror=errors.append):
+        for fname in fnames:
             ext = os.path.splitext(fname)[1].lower()
             if ext not in extensions:
                 continue
             fpath = os.path.join(root, fname)
             try:
-                img = Image.open(fpath)
-                img.load()
-                w, h = img.size
-                phash = str(imagehash.phash(img))
-            except Exception:
-                skipped += 1
+                st = os.stat(fpath)
+            except OSError:
+                skipped["stat error"] += 1
+                continue
+            if not walk_filter.size_ok(st.st_size):
                 continue
+            files[fpath] = (st.st_size, st.st_mtime_ns, fname)
+    return files, skipped, len(errors)
 
-            conn.execute(
-                "INSERT OR REPLACE INTO candidates VALUES (?, ?, ?, ?, ?)",
-                (fpath, fname, w, h, phash),
-            )
-            count += 1
-            if count % 200 == 0:
-                print(f"  Scanned {count} images...")
-                conn.commit()
 
-    conn.commit()
-    print(f"Scanned {count} candidate images ({skipped} skipped)")
+def walk_candidates(search_dir, walk_filter, existing, snapshot=None, failures=None):
+    """Walk search_dir (or use a snapshot_candidates() result already taken)
+    and return (todo, present, unchanged, skipped, errors).
 
-    # Find matches: site images (non-thumb, not in big/) matched against larger candidates
-    site_rows = conn.execute(
-        "SELECT path, project, width, height, phash FROM site_images "
-        "WHERE is_thumb = 0 AND path NOT LIKE 'images/big/%' AND path NOT LIKE 'media/%'"
+    todo holds (path, size, mtime, filename) for files that are new or differ
+    from their row in existing; skipped and errors are as for
+    snapshot_candidates(). Files that failed before (see load_failures()) and
+    haven't changed since are left out of todo and counted in skipped under
+    the same reason.
+    """
+    files, skipped, errors = snapshot or snapshot_candidates(search_dir, walk_filter)
+    skipped = Counter(skipped)
+    todo = []
+    unchanged = 0
+    for fpath, (size, mtime, fname) in files.items():
+        if is_current(existing.get(fpath), size, mtime):
+            unchanged += 1
+            continue
+        reason = failed_before(failures or {}, fpath, size, mtime)
+        if reason:
+            skipped[reason] += 1
+            continue
+        todo.append((fpath, size, mtime, fname))
+    return todo, set(files), unchanged, skipped, errors
+
+
+def is_current(row, size, mtime):
+    """True if an existing (size, mtime, digest, complete) row needs no rehash."""
+    return bool(row and row[3] and row[:2] == (size, mtime))
+
+
+def update_candidates(conn, search_dir, walk_filter, hashes=("phash",), use_digest=False,
+                      jobs=1, io_threads=4, resume=False, budget=MEMORY_BUDGET, stats=None,
+                      snapshot=None, variants=False):
+    """Bring the candidates rows under search_dir in line with what is on disk.
+
+    Files whose size and mtime match their row (and that already have every
+    requested hash) are not opened, and neither are files that failed to
+    decode with the size and mtime they still have (recorded in
+    scan_failures). With use_digest, a new file whose content digest matches
+    a row whose file has vanished is taken as a move and keeps its hashes.
+    Without it, files whose row has a digest are still digested, so the
+    stored one stays current for the next use_digest scan. Rows for files
+    that are no longer there, or that walk_filter now excludes, are deleted.
+
+    The walk result is checkpointed in images.db, so after an interruption
+    resume=True skips the walk and only hashes what wasn't finished. Returns
+    False if the scan stopped early.
+
+    Each worker decodes within budget bytes (see imageutil.open_image());
+    files skipped for that or any other reason are reported by reason.
+    Timings and counts go to stats (a runstats.RunStats). snapshot is a
+    snapshot_candidates() result to use instead of walking search_dir.
+
+    With variants, each file's CROPS are fingerprinted from the same decode
+    into candidate_variants, and rows without a full set count as incomplete.
+    """
+    if stats is None:
+        stats = RunStats("find_bigger")
+    create_candidates_table(conn)
+    create_checkpoint_tables(conn)
+    where, params = dir_prefix(search_dir)
+    missing = " OR ".join(f"{name} IS NULL" for name in hashes)
+    if variants:
+        missing_variant = " OR ".join(f"v.{name} IS NULL" for name in hashes)
+        missing += (f" OR (SELECT COUNT(*) FROM candidate_variants v WHERE v.path = candidates.path "
+                    f"AND NOT ({missing_variant})) < {len(CROPS)}")
+    existing = {
+        path: (size, mtime, digest, bool(complete))
+        for path, size, mtime, digest, complete in conn.execute(
+            f"SELECT path, size, mtime, digest, NOT ({missing}) FROM candidates WHERE {where}", params)
+    }
+    failures = load_failures(conn, "candidates", where, params)
+    stale_failures = []
+
+    checkpoint = load_checkpoint(conn, search_dir) if resume else None
+    if checkpoint is not None:
+        queued, gone_paths = checkpoint
+        todo = [item for item in queued if not is_current(existing.get(item[0]), item[1], item[2])
+                and not failed_before(failures, *item[:3])]
+        # Rows relocated by a move before the interruption are no longer under their old path
+        gone = {path: existing[path] for path in gone_paths if path in existing}
+        unchanged = len(queued) - len(todo)
+        print(f"Resuming scan of {search_dir}: {len(todo)} of {len(queued)} queued files left")
+    else:
+        with stats.stage("walk"):
+            todo, present, unchanged, skipped, errors = walk_candidates(search_dir, walk_filter, existing,
+                                                                        snapshot, failures)
+        stats.skipped.update(skipped)
+        gone = {path: row for path, row in existing.items() if path not in present}
+        stale_failures = [path for path in failures if path not in present]
+        if errors:
+            # A partial listing (say, a drive going away mid-walk) must not prune rows
+            print(f"  {errors} directories could not be listed; not removing any rows")
+            gone = {}
+            stale_failures = []
+        save_checkpoint(conn, search_dir, todo, gone)
+    moved_from = {row[2]: path for path, row in gone.items() if row[2] and row[3]}
+
+    moved = 0
+    relocate = BatchWriter(conn, "UPDATE candidates SET path = ?, filename = ?, size = ?, mtime = ? WHERE path = ?")
+    relocate_variants = BatchWriter(conn, "UPDATE candidate_variants SET path = ? WHERE path = ?")
+    rows = BatchWriter(conn, insert_sql("candidates", CANDIDATE_COLUMNS, replace=True))
+    # A rehashed file's old crop rows are stale either way
+    variant_rows = BatchWriter(conn, insert_sql("candidate_variants", VARIANT_COLUMNS, replace=True))
+    stale_variants = BatchWriter(conn, "DELETE FROM candidate_variants WHERE path = ?")
+    failed = BatchWriter(conn, insert_sql("scan_failures", FAILURE_COLUMNS, replace=True))
+    recovered = BatchWriter(conn, "DELETE FROM scan_failures WHERE source = 'candidates' AND path = ?")
+
+    def triage(item, digest):
+        """Called once a file has been read: False if its hashes can be kept."""
+        nonlocal unchanged, moved
+        fpath, size, mtime, fname = item
+        if digest is None:
+            return True
+        prev = existing.get(fpath)
+        if prev and prev[3] and prev[2] == digest:  # touched, not changed
+            relocate.add((fpath, fname, size, mtime, fpath))
+            unchanged += 1
+            return False
+        if fpath not in existing and digest in moved_from:
+            old_path = moved_from.pop(digest)
+            del gone[old_path]
+            relocate.add((fpath, fname, size, mtime, old_path))
+            relocate_variants.add((fpath, old_path))
+            moved += 1
+            return False
+        return True
+
+    # Reads, decodes and this writer all overlap; results still arrive in walk order.
+    # Leaving the with block (however it happens) flushes every writer.
+    stopped = None
+    skipped_example = {}
+    stats.total = len(todo)
+    stats.workers.update(io_threads=io_threads, jobs=jobs)
+    # Without use_digest, still keep the digests already stored up to date
+    digested = {path for path, row in existing.items() if row[2]}
+    results = scan(todo, hashes, triage, digest=use_digest or (lambda item: item[0] in digested),
+                   jobs=jobs, io_threads=io_threads, budget=budget, stats=stats, variants=tuple(CROPS) if variants else ())
+    writers = (relocate, relocate_variants, rows, variant_rows, stale_variants, failed, recovered)
+    with relocate, relocate_variants, rows, variant_rows, stale_variants, failed, recovered:
+        try:
+            for (fpath, size, mtime, fname), digest, result in results:
+                if result is not None and result[4] is not None:
+                    if not os.path.isdir(search_dir):
+                        stopped = f"{search_dir} went away"
+                        break
+                    reason, message = result[4]
+                    failed.add(("candidates", fpath, size, mtime, reason, message))
+                    stats.advance(skipped=reason)
+                    skipped_example.setdefault(reason, f"{fpath}: {message}")
+                    continue
+                if fpath in failures:
+                    recovered.add((fpath,))
+                if result is None:
+                    stats.advance(size)
+                    continue
+                w, h, fingerprints, crops, _err = result
+
+                rows.add((fpath, fname, w, h, *(fingerprints.get(name) for name in HASH_NAMES),
+                          size, mtime, digest))
+                if not crops:
+                    stale_variants.add((fpath,))
+                for transform, crop_fps in crops.items():
+                    variant_rows.add((fpath, transform, *(crop_fps.get(name) for name in HASH_NAMES)))
+                stats.advance(size)
+                if stats.progress_interval is None and rows.count % 200 == 0:
+                    print(f"  Scanned {rows.count} images...")
+        except (KeyboardInterrupt, BrokenProcessPool):
+            stopped = "interrupted"
+        finally:
+            results.close()
+    stats.took("db_write", sum(writer.seconds for writer in writers))
+
+    if stopped:
+        print(f"Scan {stopped} after {rows.count} new or changed images; "
+              "rerun with --resume to carry on from here")
+        return False
+
+    with stats.stage("db_write"):
+        with conn:
+            conn.executemany("DELETE FROM candidates WHERE path = ?", [(p,) for p in gone])
+            conn.executemany("DELETE FROM candidate_variants WHERE path = ?", [(p,) for p in gone])
+            conn.executemany("DELETE FROM scan_failures WHERE source = 'candidates' AND path = ?",
+                             [(p,) for p in stale_failures])
+            clear_checkpoint(conn, search_dir)
+        create_indexes(conn, "candidates")
+    skipped = stats.skipped
+    print(f"Scanned {rows.count} new or changed candidate images "
+          f"({unchanged} unchanged, {moved} moved, {len(gone)} removed, {skipped.total()} skipped)")
+    for reason, count in skipped.most_common():
+        example = skipped_example.get(reason)
+        print(f"  {count} skipped ({reason})" + (f", e.g. {example}" if example else ""))
+    return True
+
+
+def load_candidates(conn, search_dir, extra, min_pixels=0, variants=False):
+    """CandidateList of the hashed candidates under search_dir with more than
+    min_pixels pixels, served by the candidates_pixels index, and with
+    variants their CROPS too."""
+    where, params = dir_prefix(search_dir)
+    extra_cols = "".join(f", {name}" for name in extra)
+    rows = conn.execute(
+        f"SELECT path, width, height, phash{extra_cols} FROM candidates "
+        f"WHERE {where} AND phash IS NOT NULL AND width * height > ?",
+        (*params, min_pixels),
     ).fetchall()
+    crop_rows = conn.execute(
+        f"SELECT path, transform, phash{extra_cols} FROM candidate_variants "
+        f"WHERE {where} AND phash IS NOT NULL", params,
+    ).fetchall() if variants else []
+    return candidate_list(rows, crop_rows, extra, min_pixels)
+
+
+def export_candidates(conn, search_dir, out_path):
+    """Write every hashed candidate under search_dir to a hashfile index."""
+    where, params = dir_prefix(search_dir)
+    rows = conn.execute(f"SELECT path, width, height, {', '.join(HASH_NAMES)} FROM candidates "
+                        f"WHERE {where} AND phash IS NOT NULL", params)
+    index = HashFile.from_rows((path, w, h, dict(zip(HASH_NAMES, fps))) for path, w, h, *fps in rows)
+    index.save(out_path)
+    print(f"Exported {len(index)} candidates to {out_path}")
+
+
+def scan_candidates(search_dir, exclude_dirs=None, hashes=("phash",), engine="index",
+                    use_digest=False, jobs=1, io_threads=4, ignore=(), min_size=None, max_size=None,
+                    resume=False, budget=MEMORY_BUDGET, top=None, variants=False,
+                    aspect_tolerance=None, index_files=(), export=None, progress=None, metrics=None,
+                    watch=None, watch_site=False):
+    """Update the candidates under search_dir, then match every site image
+    against them. With top, only the top best matches per site image are kept,
+    ranked by a correlation check of the actual pixels (the score column).
+    With variants, the site images' rotated/flipped fingerprints are searched
+    as well, and so are center crops of the candidates (fingerprinted as they
+    are scanned), and the transform that matched is recorded. With
+    aspect_tolerance, candidates whose aspect ratio differs by more than that
+    fraction are never compared.
+
+    With index_files (hashfile indexes) instead of a search_dir, nothing is
+    scanned and the site images are matched against those. export writes
+    the scanned candidates out as such an index.
 
-    cand_rows = conn.execute(
-        "SELECT path, width, height, phash FROM candidates"
+    Run metrics are printed at the end, and written as JSON to metrics if
+    given; progress prints a progress line that often (in seconds).
+
+    With watch (seconds), keep polling search_dir afterwards (and with
+    watch_site the site images too) and rematch the site images each change
+    affects; see watch_changes().
+
+    Returns False if a scan stopped early (interrupted, or search_dir went
+    away), leaving a checkpoint for --resume."""
+    if exclude_dirs is None:
+        exclude_dirs = []
+
+    stats = RunStats("find_bigger", progress)
+    conn = connect(DB_PATH)
+    snapshot = None
+    if not index_files:
+        search_dir = os.path.abspath(search_dir)
+        walk_filter = WalkFilter(exclude_dir_patterns(search_dir, exclude_dirs) + list(ignore),
+                                 min_size, max_size)
+        if watch and not resume:
+            with stats.stage("walk"):
+                snapshot = snapshot_candidates(search_dir, walk_filter)
+        if not update_candidates(conn, search_dir, walk_filter, hashes, use_digest, jobs, io_threads,
+                                 resume, budget, stats, snapshot, variants):
+            conn.close()
+            stats.report(metrics)
+            return False
+        if export:
+            export_candidates(conn, search_dir, export)
+
+    with stats.stage("match"):
+        match_count = match_sites(conn, search_dir, hashes, engine, budget, top, variants,
+                                  aspect_tolerance, index_files, stats)
+    report_matches(conn, search_dir, hashes, top, match_count)
+    stats.report(metrics)
+    complete = True
+    if watch:
+        complete = watch_changes(conn, search_dir, walk_filter, watch, watch_site, snapshot, hashes,
+                                 engine, use_digest, jobs, io_threads, budget, top, variants,
+                                 aspect_tolerance)
+    conn.close()
+    return complete
+
+
+def snapshot_site():
+    """{site image path relative to SITE_ROOT: (size, mtime)}, as catalog_images sees them."""
+    files = {}
+    for fpath, _fname in site_image_files():
+        try:
+            st = os.stat(fpath)
+        except OSError:
+            continue
+        files[os.path.relpath(fpath, SITE_ROOT)] = (st.st_size, st.st_mtime_ns)
+    return files
+
+
+def changed_paths(before, after):
+    """Paths added, removed or with a different (size, mtime) between two snapshots."""
+    return {path for path in before.keys() | after.keys() if before.get(path) != after.get(path)}
+
+
+def watch_changes(conn, search_dir, walk_filter, interval, watch_site=False, snapshot=None,
+                  hashes=("phash",), engine="index", use_digest=False, jobs=1, io_threads=4,
+                  budget=MEMORY_BUDGET, top=None, variants=False, aspect_tolerance=None):
+    """Poll search_dir every interval seconds and keep the candidates and
+    matches tables current until interrupted.
+
+    Each poll stats every file (no decoding) and compares sizes and mtimes
+    with the previous poll; when something differs, only the new and changed
+    files are hashed, and only the site images the change can affect are
+    rematched: those matched to a changed or removed candidate, and those a
+    new or changed candidate now matches. With watch_site, changed site
+    images are recataloged (catalog_images.py --incremental) and rematched
+    the same way.
+
+    snapshot is the snapshot_candidates() result the last scan used; without
+    one, the first poll treats every file as new (which costs a full rematch
+    but no rehashing).
+
+    Returns False if it stopped in the middle of a scan, True if it stopped
+    between polls.
+    """
+    extra = [name for name in hashes if name != "phash"]
+    files = snapshot[0] if snapshot else {}
+    site_files = snapshot_site() if watch_site else None
+    print(f"\nWatching {search_dir}" + (" and the site images" if watch_site else "")
+          + f" every {interval:g}s; Ctrl-C to stop")
+    try:
+        while True:
+            time.sleep(interval)
+            affected = set()
+
+            if watch_site:
+                current = snapshot_site()
+                changed_sites = changed_paths(site_files, current)
+                if changed_sites:
+                    print(f"\n{len(changed_sites)} site images changed")
+                    catalog(incremental=True, jobs=jobs, hashes=hashes, variants=variants)
+                    affected |= changed_sites
+                site_files = current
+
+            snapshot = snapshot_candidates(search_dir, walk_filter)
+            changed = changed_paths(files, snapshot[0])
+            if changed:
+                print(f"\n{len(changed)} candidate files changed")
+                if not update_candidates(conn, search_dir, walk_filter, hashes, use_digest, jobs,
+                                         io_threads, budget=budget, snapshot=snapshot, variants=variants):
+                    return False
+                affected |= affected_sites(conn, changed, extra, engine, variants, aspect_tolerance)
+            files = snapshot[0]
+
+            if affected:
+                stats = RunStats("find_bigger")
+                match_count = match_sites(conn, search_dir, hashes, engine, budget, top, variants,
+                                          aspect_tolerance, (), stats, only=affected)
+                report_matches(conn, search_dir, hashes, top, match_count, only=affected)
+    except KeyboardInterrupt:
+        print("\nStopped watching")
+    return True
+
+
+def load_candidate_paths(conn, paths, extra, variants=False):
+    """CandidateList of the hashed candidates among paths (with variants,
+    their CROPS too)."""
+    extra_cols = "".join(f", {name}" for name in extra)
+    rows = []
+    crop_rows = []
+    for path in paths:
+        row = conn.execute(f"SELECT path, width, height, phash{extra_cols} FROM candidates "
+                           "WHERE path = ? AND phash IS NOT NULL", (path,)).fetchone()
+        if row:
+            rows.append(row)
+        if row and variants:
+            crop_rows += conn.execute(f"SELECT path, transform, phash{extra_cols} FROM candidate_variants "
+                                      "WHERE path = ? AND phash IS NOT NULL", (path,)).fetchall()
+    return candidate_list(rows, crop_rows, extra)
+
+
+def affected_sites(conn, changed, extra, engine, variants, aspect_tolerance):
+    """Site paths whose matches can differ now that the candidates at the
+    changed paths were added, rehashed or removed: those matched to one of
+    them before, and those one of them matches now."""
+    affected = set()
+    for path in changed:
+        affected.update(site_path for (site_path,) in conn.execute(
+            "SELECT site_path FROM matches WHERE candidate_path = ?", (path,)))
+    cand_hashes = load_candidate_paths(conn, changed, extra, variants)
+    if len(cand_hashes):
+        site_rows, queries, _site_variants = site_queries(conn, extra, variants)
+        found_per_query = ENGINES[engine](cand_hashes, aspect_tolerance)([query[2:5] for query in queries])
+        for i, group in groupby(zip(queries, found_per_query), key=lambda qf: qf[0][0]):
+            if merge_variant_matches(group, cand_hashes):
+                affected.add(site_rows[i][0])
+    return affected
+
+
+def site_queries(conn, extra, variants, only=None):
+    """Return (site rows, queries, site variants) for matching: the site
+    images (non-thumb, not in big/) that have a phash, restricted to the
+    paths in only if given, and one query per image plus one per stored
+    variant."""
+    # Extra fingerprints are only compared where the site row has them too.
+    add_hash_columns(conn, "site_images")
+    extra_cols = "".join(f", {name}" for name in extra)
+    site_rows = conn.execute(
+        f"SELECT path, project, width, height, phash{extra_cols} FROM site_images "
+        "WHERE is_thumb = 0 AND path NOT LIKE 'images/big/%' AND path NOT LIKE 'media/%' "
+        "AND phash IS NOT NULL"
     ).fetchall()
+    if only is not None:
+        site_rows = [row for row in site_rows if row[0] in only]
+
+    # Every site image is one query, plus one per stored variant
+    site_variants = load_site_variants(conn, extra_cols) if variants else {}
+    # (site row, transform, hash, pixels, log aspect, extra hashes)
+    queries = []
+    for i, (spath, _project, sw, sh, shash, *sextra) in enumerate(site_rows):
+        queries.append((i, None, shash, sw * sh, log_aspect(sw, sh), extra_hashes(extra, sextra)))
+        for transform, vhash, *vextra in site_variants.get(spath, ()):
+            aspect = log_aspect(sh, sw) if transform in QUARTER_TURNS else log_aspect(sw, sh)
+            queries.append((i, transform, vhash, sw * sh, aspect, extra_hashes(extra, vextra)))
+    return site_rows, queries, site_variants
+
+
+def match_sites(conn, search_dir, hashes, engine, budget, top, variants, aspect_tolerance,
+                index_files, stats, only=None):
+    """Rebuild the matches table; returns the number of matches. With only
+    (a set of site paths), just those site images' rows are replaced."""
+    extra = [name for name in hashes if name != "phash"]
+    site_rows, queries, site_variants = site_queries(conn, extra, variants, only)
 
-    # Convert candidate hashes for comparison
-    cand_hashes = []
-    for cpath, cw, ch, cphash in cand_rows:
-        cand_hashes.append((cpath, cw, ch, imagehash.hex_to_hash(cphash)))
+    if len(index_files) == 1:
+        cand_hashes = HashFile.open(index_files[0])
+    elif index_files:
+        cand_hashes = HashFile.merge(HashFile.open(f) for f in index_files)
+    else:
+        # Nothing smaller than every site image can match
+        min_pixels = min((row[2] * row[3] for row in site_rows), default=0)
+        cand_hashes = load_candidates(conn, search_dir, extra, min_pixels, variants)
 
-    print(f"Comparing {len(site_rows)} site images against {len(cand_hashes)} candidates...")
+    if variants:
+        missing = sum(1 for row in site_rows if row[0] not in site_variants)
+        if missing:
+            print(f"  {missing} site images have no variant fingerprints; "
+                  "run catalog_images.py --incremental --variants")
+
+    via = f" ({len(queries)} fingerprints with variants)" if variants else ""
+    crops = sum(1 for j in range(len(cand_hashes)) if cand_hashes.crop(j)) if variants else 0
+    also = f" (and {crops} crops of them)" if crops else ""
+    print(f"Comparing {len(site_rows)} site images{via} against {len(cand_hashes) - crops} candidates{also}...")
 
     # Create matches table
-    conn.execute("DROP TABLE IF EXISTS matches")
+    if only is None:
+        conn.execute("DROP TABLE IF EXISTS matches")
     conn.execute("""
-        CREATE TABLE matches (
+        CREATE TABLE IF NOT EXISTS matches (
             site_path       TEXT,
             site_project    TEXT,
             site_width      INTEGER,
@@ -100,60 +862,151 @@ def scan_candidates(search_dir, exclude_dirs=None):
             candidate_path  TEXT,
             cand_width      INTEGER,
             cand_height     INTEGER,
-            hamming         INTEGER
+            hamming         INTEGER,
+            score           REAL,
+            transform       TEXT
         )
     """)
+    if only is not None:
+        with conn:
+            conn.executemany("DELETE FROM matches WHERE site_path = ?", [(p,) for p in only])
 
-    match_count = 0
-    for i, (spath, project, sw, sh, sphash_hex) in enumerate(site_rows):
-        shash = imagehash.hex_to_hash(sphash_hex)
-        site_pixels = sw * sh
-        for cpath, cw, ch, chash in cand_hashes:
-            dist = shash - chash
-            cand_pixels = cw * ch
-            if dist <= THRESHOLD and cand_pixels > site_pixels:
-                conn.execute(
-                    "INSERT INTO matches VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
-                    (spath, project, sw, sh, cpath, cw, ch, dist),
-                )
-                match_count += 1
+    matches = BatchWriter(conn, "INSERT INTO matches VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)")
+    match = ENGINES[engine](cand_hashes, aspect_tolerance)
+    renditions = RenditionCache(budget) if top else None
+    found_per_query = match([query[2:5] for query in queries])
+    per_site = groupby(zip(queries, found_per_query), key=lambda qf: qf[0][0])
+    for i, group in per_site:
+        spath, project, sw, sh = site_rows[i][:4]
+        found = merge_variant_matches(group, cand_hashes)
+        if top:
+            ranked = rank_matches(renditions, os.path.join(SITE_ROOT, spath), found, cand_hashes)[:top]
+        else:
+            ranked = [(j, dist, transform, None) for j, dist, transform in found]
+        for j, dist, transform, score in ranked:
+            cpath, cw, ch, _chash, _cextra = cand_hashes[j]
+            matches.add((spath, project, sw, sh, cpath, cw, ch, dist, score, transform))
         if (i + 1) % 50 == 0:
-            print(f"  Compared {i + 1}/{len(site_rows)} site images, {match_count} matches so far...")
+            print(f"  Compared {i + 1}/{len(site_rows)} site images, {matches.count} matches so far...")
+
+    matches.flush()
+    stats.took("db_write", matches.seconds)
+    with stats.stage("db_write"):
+        create_indexes(conn, "matches")
+    return matches.count
 
-    conn.commit()
 
-    # Report
-    print(f"\nFound {match_count} matches (candidate larger than site image, hamming <= {THRESHOLD})")
+def report_matches(conn, search_dir, hashes, top, match_count, only=None):
+    """Print the matches table (or with only, the rows for those site paths)."""
+    extra = [name for name in hashes if name != "phash"]
+    also = "".join(f", {name} <= {HASH_THRESHOLDS[name]}" for name in extra)
+    best = f", best {top} per site image" if top else ""
+    changed = f" for {len(only)} changed site images" if only is not None else ""
+    print(f"\nFound {match_count} matches{changed} (candidate larger than site image, "
+          f"hamming <= {THRESHOLD}{also}{best})")
     print()
 
-    rows = conn.execute("""
+    rows = conn.execute(f"""
         SELECT site_path, site_project,
                site_width || 'x' || site_height AS site_size,
                cand_width || 'x' || cand_height AS cand_size,
-               hamming, candidate_path
+               hamming, score, transform, candidate_path
         FROM matches
-        ORDER BY hamming, site_path
+        ORDER BY {"site_path, score DESC, hamming" if top else "hamming, site_path"}
     """).fetchall()
+    if only is not None:
+        rows = [row for row in rows if row[0] in only]
 
     if rows:
-        print(f"{'Site Image':<28} {'Project':<35} {'Site Size':<12} {'Candidate Size':<15} {'Dist':<5} Candidate Path")
-        print("-" * 160)
-        for site_path, project, ssize, csize, dist, cpath in rows:
-            short_cpath = cpath.replace(search_dir, "...")
-            print(f"{site_path:<28} {project:<35} {ssize:<12} {csize:<15} {dist:<5} {short_cpath}")
-
-    conn.close()
+        print(f"{'Site Image':<28} {'Project':<35} {'Site Size':<12} {'Candidate Size':<15} {'Dist':<5} "
+              f"{'Score':<6} Candidate Path")
+        print("-" * 167)
+        for site_path, project, ssize, csize, dist, score, transform, cpath in rows:
+            short_cpath = cpath.replace(search_dir, "...") if search_dir else cpath
+            if transform:
+                short_cpath += f" ({transform})"
+            score = "-" if score is None else f"{score:.2f}"
+            print(f"{site_path:<28} {project:<35} {ssize:<12} {csize:<15} {dist:<5} {score:<6} {short_cpath}")
 
 
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Usage: python3 find_bigger.py <search_directory> [--exclude dir1 dir2 ...]")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("search_dir", nargs="?", help="directory to search for larger originals")
+    parser.add_argument("--exclude", nargs="*", default=[], metavar="DIR",
+                        help="directories to skip")
+    parser.add_argument("--ignore", action="append", default=[], metavar="PATTERN",
+                        help="gitignore-style pattern to skip, relative to search_directory (repeatable)")
+    parser.add_argument("--ignore-file", metavar="FILE",
+                        help="file of gitignore-style patterns to skip")
+    parser.add_argument("--min-size", type=parse_size, metavar="SIZE",
+                        help="skip files smaller than this (e.g. 50k)")
+    parser.add_argument("--max-size", type=parse_size, metavar="SIZE",
+                        help="skip files larger than this (e.g. 2G)")
+    parser.add_argument("--hashes", type=parse_hash_names, default=("phash",),
+                        help=f"comma-separated fingerprints to compute and require "
+                             f"({', '.join(HASH_NAMES)}); phash is always included")
+    parser.add_argument("--engine", choices=sorted(ENGINES), default="index",
+                        help="how to find larger candidates within THRESHOLD (default: index)")
+    parser.add_argument("--index", action="append", default=[], metavar="FILE",
+                        help="match against this index file (see hashfile.py) instead of scanning (repeatable)")
+    parser.add_argument("--export", metavar="FILE",
+                        help="after scanning, write the candidates under search_dir to an index file")
+    parser.add_argument("--digest", action="store_true",
+                        help="store content digests so touched and moved files aren't re-decoded")
+    parser.add_argument("--top", type=int, metavar="K",
+                        help="keep only the K best matches per site image, re-ranked by comparing "
+                             "small renditions of both images (fills the score column)")
+    parser.add_argument("--aspect-tolerance", type=float, metavar="FRACTION",
+                        help="only compare candidates whose aspect ratio is within this fraction of "
+                             "the site image's (e.g. 0.05); default: any shape")
+    parser.add_argument("--variants", action="store_true",
+                        help="also match the site images' rotated and mirrored fingerprints (from "
+                             "catalog_images.py --variants), and center crops of the candidates "
+                             f"({', '.join(CROPS)}), fingerprinted as they are scanned")
+    parser.add_argument("--resume", action="store_true",
+                        help="continue an interrupted scan of search_directory without re-walking it")
+    parser.add_argument("--watch", type=float, metavar="SECONDS",
+                        help="after the scan, keep polling search_directory this often, hashing new "
+                             "and changed files and rematching the site images they affect")
+    parser.add_argument("--watch-site", action="store_true",
+                        help="with --watch, also recatalog and rematch site images that change")
+    parser.add_argument("--progress", type=float, metavar="SECONDS",
+                        help="print a progress line with rates and ETA this often while scanning")
+    parser.add_argument("--metrics", metavar="FILE",
+                        help="write run metrics (stage times, rates, skips, peak RSS) as JSON; - for stdout")
+    parser.add_argument("--jobs", "-j", type=int, default=1,
+                        help="worker processes for decoding/hashing (0 = one per core)")
+    parser.add_argument("--io-threads", type=int, default=4,
+                        help="threads prefetching file contents (default: 4)")
+    parser.add_argument("--memory-budget", type=parse_size, default=MEMORY_BUDGET, metavar="SIZE",
+                        help="decoded pixels each worker may hold; bigger images are read at reduced "
+                             f"resolution or skipped (default: {MEMORY_BUDGET >> 20}M)")
+    args = parser.parse_args()
+    if bool(args.search_dir) == bool(args.index):
+        parser.error("give either a search directory or --index files")
+    if args.watch and args.index:
+        parser.error("--watch needs a search directory, not --index files")
+    if args.watch_site and not args.watch:
+        parser.error("--watch-site needs --watch")
 
-    search_dir = sys.argv[1]
-    exclude_dirs = []
-    if "--exclude" in sys.argv:
-        idx = sys.argv.index("--exclude")
-        exclude_dirs = sys.argv[idx + 1:]
+    ignore = args.ignore
+    if args.ignore_file:
+        ignore = WalkFilter.read_ignore_file(args.ignore_file) + ignore
 
-    scan_candidates(search_dir, exclude_dirs)
+    # Stop on SIGTERM the same way as on Ctrl-C: flush, checkpoint, exit
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    try:
+        complete = scan_candidates(
+            args.search_dir, args.exclude, args.hashes, args.engine, args.digest,
+            jobs=args.jobs or os.cpu_count() or 1, io_threads=args.io_threads,
+            ignore=ignore, min_size=args.min_size, max_size=args.max_size,
+            resume=args.resume, budget=args.memory_budget, top=args.top,
+            variants=args.variants, aspect_tolerance=args.aspect_tolerance,
+            index_files=args.index, export=args.export, progress=args.progress,
+            metrics=args.metrics, watch=args.watch, watch_site=args.watch_site)
+    except KeyboardInterrupt:
+        print("\nInterrupted")
+        sys.exit(130)
+    if not complete:
+        # The scan caught the interrupt (or lost search_dir) and checkpointed
+        sys.exit(130)
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""Portable binary candidate index files.
+
+An index file holds what find_bigger needs to match against a set of
+candidates without images.db or the drive they came from, so archives can be
+scanned on the machines they are plugged into and matched on one box:
+
+    python3 find_bigger.py /Volumes/Archive1 --export archive1.fbx
+    python3 hashfile.py merge all.fbx archive1.fbx archive2.fbx
+    python3 find_bigger.py --index all.fbx
+
+(or --index archive1.fbx --index archive2.fbx, merged in memory).
+
+Layout, all little-endian: a HEADER, then count fixed-width RECORD rows
+sorted by pixel count, then a table of UTF-8 paths that the records point
+into. Opening a file memory-maps the records, so even millions of entries
+load without copying.
+
+Run directly to merge files or describe one:
+
+    python3 hashfile.py merge OUT IN [IN ...]
+    python3 hashfile.py info FILE
+"""
+
+import argparse
+import os
+import struct
+import numpy as np
+from imageutil import HASH_NAMES
+
+MAGIC = b"FBHASHIX"
+VERSION = 1
+
+# magic, version, record size, record count, path table size
+HEADER = struct.Struct("<8sIIQQ")
+
+# One fingerprint column per HASH_NAMES entry; bit i of present is set when
+# HASH_NAMES[i] was computed for the file
+RECORD = np.dtype([
+    *((name, "<i8") for name in HASH_NAMES),
+    ("width", "<u4"),
+    ("height", "<u4"),
+    ("path_offset", "<u8"),
+    ("path_length", "<u4"),
+    ("present", "<u4"),
+])
+
+
+class HashFile:
+    """Candidate fingerprints as a record array sorted by pixel count.
+
+    Indexing gives the same (path, width, height, phash, {extra: int})
+    tuples find_bigger builds from the candidates table, and hashes, pixels
+    and aspects are the arrays its match engines work on.
+    """
+
+    def __init__(self, records, paths):
+        self.records = records
+        self.paths = paths
+        self.hashes = records["phash"]
+        width = records["width"].astype(np.int64)
+        height = records["height"].astype(np.int64)
+        self.pixels = width * height
+        self.aspects = np.log(width / height)
+
+    @classmethod
+    def open(cls, fpath):
+        """Memory-map an index file."""
+        with open(fpath, "rb") as f:
+            magic, version, record_size, count, paths_size = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError(f"{fpath} is not a candidate index file")
+        if version != VERSION or record_size != RECORD.itemsize:
+            raise ValueError(f"{fpath} is index version {version}, expected {VERSION}")
+        if count == 0:
+            return cls(np.zeros(0, dtype=RECORD), b"")
+        records = np.memmap(fpath, dtype=RECORD, mode="r", offset=HEADER.size, shape=(count,))
+        paths = np.memmap(fpath, dtype=np.uint8, mode="r",
+                          offset=HEADER.size + count * RECORD.itemsize, shape=(paths_size,))
+        return cls(records, paths)
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Build an index from (path, width, height, {name: int or None}) rows."""
+        rows = sorted(rows, key=lambda row: (row[1] * row[2], row[0]))
+        records = np.zeros(len(rows), dtype=RECORD)
+        table = bytearray()
+        for i, (path, w, h, fingerprints) in enumerate(rows):
+            encoded = path.encode("utf-8")
+            rec = records[i]
+            rec["width"], rec["height"] = w, h
+            rec["path_offset"], rec["path_length"] = len(table), len(encoded)
+            present = 0
+            for bit, name in enumerate(HASH_NAMES):
+                value = fingerprints.get(name)
+                if value is not None:
+                    rec[name] = value
+                    present |= 1 << bit
+            rec["present"] = present
+            table += encoded
+        return cls(records, bytes(table))
+
+    @classmethod
+    def merge(cls, files):
+        """Combine several indexes; a path in more than one keeps the last."""
+        rows = {}
+        for hashfile in files:
+            for i in range(len(hashfile)):
+                path = hashfile.path(i)
+                rows[path] = (path, int(hashfile.records[i]["width"]), int(hashfile.records[i]["height"]),
+                              hashfile.fingerprints(i))
+        return cls.from_rows(rows.values())
+
+    def save(self, fpath):
+        """Write the index, replacing fpath only once it is complete."""
+        tmp_path = fpath + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, VERSION, RECORD.itemsize, len(self.records), len(self.paths)))
+            f.write(np.ascontiguousarray(self.records).tobytes())
+            f.write(bytes(self.paths))
+        os.replace(tmp_path, fpath)
+
+    def __len__(self):
+        return len(self.records)
+
+    def path(self, i):
+        rec = self.records[i]
+        start = int(rec["path_offset"])
+        return bytes(self.paths[start:start + int(rec["path_length"])]).decode("utf-8")
+
+    def fingerprints(self, i):
+        rec = self.records[i]
+        present = int(rec["present"])
+        return {name: int(rec[name]) for bit, name in enumerate(HASH_NAMES) if present >> bit & 1}
+
+    def __getitem__(self, i):
+        rec = self.records[i]
+        extra = self.fingerprints(i)
+        phash = extra.pop("phash")
+        return self.path(i), int(rec["width"]), int(rec["height"]), phash, extra
+
+    def crop(self, i):
+        """Index files only hold whole images, never CROPS."""
+        return None
+
+
+def describe(hashfile):
+    present = hashfile.records["present"]
+    counts = ", ".join(f"{int(np.count_nonzero(present >> bit & 1))} {name}"
+                       for bit, name in enumerate(HASH_NAMES))
+    print(f"{len(hashfile)} candidates ({counts})")
+    if len(hashfile):
+        print(f"  {hashfile.pixels[0] / 1e6:.2f} to {hashfile.pixels[-1] / 1e6:.2f} megapixels")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Merge or describe candidate index files.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    merge = commands.add_parser("merge", help="combine index files into one")
+    merge.add_argument("out", help="index file to write")
+    merge.add_argument("inputs", nargs="+", help="index files to read")
+    info = commands.add_parser("info", help="summarize an index file")
+    info.add_argument("file")
+    args = parser.parse_args()
+
+    if args.command == "merge":
+        merged = HashFile.merge(HashFile.open(p) for p in args.inputs)
+        merged.save(args.out)
+        print(f"Wrote {args.out}: ", end="")
+        describe(merged)
+    else:
+        describe(HashFile.open(args.file))
@@ -0,0 +1,102 @@
+"""Radius searches over 64-bit fingerprints: a NumPy XOR/popcount kernel and
+multi-index hashing.
+
+For multi-index hashing, each fingerprint is split into CHUNKS equal substrings
+and filed under each of them. If two fingerprints are within distance r, at
+least one substring pair is within r // CHUNKS (pigeonhole), so a search only
+has to probe the buckets near each of the query's substrings and verify what
+it finds there.
+"""
+
+from collections import defaultdict
+from itertools import combinations
+import numpy as np
+from imageutil import hamming
+
+MASK64 = 0xFFFFFFFFFFFFFFFF
+CHUNKS = 4
+
+
+if hasattr(np, "bitwise_count"):  # NumPy 2.0+
+    popcount64 = np.bitwise_count
+else:
+    _BYTE_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+    def popcount64(a):
+        return _BYTE_POPCOUNT[a.view(np.uint8)].reshape(a.shape + (8,)).sum(axis=-1, dtype=np.uint8)
+
+
+def hamming_block(queries, hashes, radius):
+    """Distances between every query and every hash (both uint64 arrays).
+
+    Returns (distances, within) as len(queries) x len(hashes) arrays, where
+    within is distances <= radius.
+    """
+    dists = popcount64(queries[:, None] ^ hashes[None, :])
+    return dists, dists <= radius
+
+
+def flip_masks(bits, radius):
+    """All masks over `bits` bits with at most `radius` bits set."""
+    masks = []
+    for k in range(min(radius, bits) + 1):
+        for positions in combinations(range(bits), k):
+            m = 0
+            for p in positions:
+                m |= 1 << p
+            masks.append(m)
+    return masks
+
+
+class HammingIndex:
+    """Index a list of fingerprints (signed 64-bit ints) for radius searches.
+
+    search() returns the same (position, distance) pairs, in the same order,
+    as scanning the list and keeping everything within the radius. keys, if
+    given, holds a number per position that searches can be limited to a
+    range of.
+    """
+
+    def __init__(self, hashes, chunks=CHUNKS, keys=None):
+        self.hashes = hashes
+        self.keys = keys
+        self.chunks = chunks
+        self.bits = 64 // chunks
+        self.chunk_mask = (1 << self.bits) - 1
+        self.tables = [defaultdict(list) for _ in range(chunks)]
+        self._masks = {}
+        for i, h in enumerate(hashes):
+            for c, key in enumerate(self._keys(h)):
+                self.tables[c][key].append(i)
+
+    def _keys(self, h):
+        u = h & MASK64
+        return [(u >> (c * self.bits)) & self.chunk_mask for c in range(self.chunks)]
+
+    def search(self, h, radius, start=0, key_range=None):
+        """Return sorted [(position, distance)] for every hash within radius
+        of h, ignoring positions before start and, with key_range (low, high),
+        positions whose key is outside it. Those are skipped before their
+        distance is computed."""
+        per_chunk = radius // self.chunks
+        masks = self._masks.get(per_chunk)
+        if masks is None:
+            masks = self._masks[per_chunk] = flip_masks(self.bits, per_chunk)
+
+        low, high = key_range or (None, None)
+        keys = self.keys
+        seen = set()
+        found = []
+        for table, key in zip(self.tables, self._keys(h)):
+            for m in masks:
+                for i in table.get(key ^ m, ()):
+                    if i < start or i in seen:
+                        continue
+                    seen.add(i)
+                    if key_range is not None and not low <= keys[i] <= high:
+                        continue
+                    dist = hamming(h, self.hashes[i])
+                    if dist <= radius:
+                        found.append((i, dist))
+        found.sort()
+        return found
@@ -0,0 +1,181 @@
+"""SQLite helpers shared by catalog_images and find_bigger.
+
+Fingerprints are stored as signed 64-bit INTEGER columns and every connection
+gets a hamming(a, b) SQL function, so ad-hoc lookups stay inside SQLite:
+
+    SELECT path, hamming(phash, :h) AS dist FROM site_images
+    WHERE hamming(phash, :h) <= 6 ORDER BY dist
+"""
+
+import sqlite3
+import time
+from imageutil import HASH_NAMES, hamming, hex_to_int
+
+FINGERPRINT_TABLES = ("site_images", "candidates")
+
+# Rows buffered per executemany/commit
+BATCH_SIZE = 500
+
+# WAL keeps a reader (say, a sqlite3 shell watching a long scan) from blocking
+# the writer; with WAL, synchronous=NORMAL only risks the last batch on power loss.
+PRAGMAS = (
+    "journal_mode = WAL",
+    "synchronous = NORMAL",
+    "cache_size = -65536",  # 64 MB
+    "temp_store = MEMORY",
+)
+
+# Secondary indexes, built after a bulk load rather than maintained row by row
+INDEXES = {
+    "site_images": {
+        "site_images_project": "project",
+        "site_images_phash": "phash",
+    },
+    "site_variants": {
+        "site_variants_phash": "phash",
+    },
+    "candidates": {
+        "candidates_phash": "phash",
+        "candidates_pixels": "width * height",
+    },
+    "matches": {
+        "matches_site_path": "site_path",
+        "matches_hamming": "hamming, site_path",
+        "matches_candidate_path": "candidate_path",
+    },
+}
+
+
+def connect(db_path):
+    """Open images.db tuned for bulk loads, with hamming() registered and old
+    hex columns migrated."""
+    conn = sqlite3.connect(db_path)
+    for pragma in PRAGMAS:
+        conn.execute(f"PRAGMA {pragma}")
+    conn.create_function("hamming", 2, hamming, deterministic=True)
+    migrate_hashes(conn)
+    return conn
+
+
+class BatchWriter:
+    """Buffer parameter rows for one statement and write them with executemany,
+    one transaction per batch. Use as a context manager so the tail is flushed.
+    seconds accumulates the time spent writing."""
+
+    def __init__(self, conn, sql, batch_size=BATCH_SIZE):
+        self.conn = conn
+        self.sql = sql
+        self.batch_size = batch_size
+        self.rows = []
+        self.count = 0
+        self.seconds = 0.0
+
+    def add(self, row):
+        self.rows.append(row)
+        self.count += 1
+        if len(self.rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.rows:
+            start = time.perf_counter()
+            with self.conn:
+                self.conn.executemany(self.sql, self.rows)
+            self.rows = []
+            self.seconds += time.perf_counter() - start
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.flush()
+
+
+def insert_sql(table, cols, replace=False):
+    verb = "INSERT OR REPLACE" if replace else "INSERT"
+    return f"{verb} INTO {table} ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))})"
+
+
+FAILURE_COLUMNS = ("source", "path", "size", "mtime", "reason", "message")
+
+
+def create_failures_table(conn):
+    """Files a scan could not fingerprint, by the table they were meant for
+    (source), with the size and mtime they had then, so later scans can leave
+    them alone until they change."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS scan_failures (
+            source      TEXT,
+            path        TEXT,
+            size        INTEGER,
+            mtime       INTEGER,
+            reason      TEXT,
+            message     TEXT,
+            PRIMARY KEY (source, path)
+        )
+    """)
+
+
+def load_failures(conn, source, where="1", params=()):
+    """{path: (size, mtime, reason)} of the failures recorded for source,
+    limited to the rows matching the SQL condition where."""
+    create_failures_table(conn)
+    return {path: (size, mtime, reason) for path, size, mtime, reason in conn.execute(
+        f"SELECT path, size, mtime, reason FROM scan_failures WHERE source = ? AND {where}",
+        (source, *params))}
+
+
+def failed_before(failures, path, size, mtime):
+    """The reason recorded in failures for path if the file hasn't changed since, else None."""
+    row = failures.get(path)
+    return row[2] if row and row[:2] == (size, mtime) else None
+
+
+def create_indexes(conn, table):
+    """(Re)build a table's secondary indexes once its rows are in."""
+    with conn:
+        for name, cols in INDEXES.get(table, {}).items():
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({cols})")
+
+
+def add_columns(conn, table, columns):
+    """Add any of {name: type} missing from a table created by an older version."""
+    existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+    for name, typ in columns.items():
+        if name not in existing:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {typ}")
+
+
+def add_hash_columns(conn, table):
+    add_columns(conn, table, {name: "INTEGER" for name in HASH_NAMES})
+
+
+def migrate_hashes(conn):
+    """Rebuild tables that still hold fingerprints as hex TEXT with INTEGER columns.
+
+    SQLite can't change a column's type in place (and TEXT affinity would turn
+    the ints straight back into strings), so the table is copied.
+    """
+    conn.create_function("hex_to_int", 1, hex_to_int, deterministic=True)
+    for table in FINGERPRINT_TABLES:
+        info = conn.execute(f"PRAGMA table_info({table})").fetchall()
+        if not any(name in HASH_NAMES and typ.upper() == "TEXT" for _, name, typ, *_ in info):
+            continue
+
+        cols = []
+        selects = []
+        for _cid, name, typ, _notnull, _default, pk in info:
+            if name in HASH_NAMES:
+                typ = "INTEGER"
+                selects.append(f"hex_to_int({name})")
+            else:
+                selects.append(name)
+            cols.append(f"{name} {typ}" + (" PRIMARY KEY" if pk else ""))
+
+        conn.execute(f"DROP TABLE IF EXISTS {table}_new")
+        conn.execute(f"CREATE TABLE {table}_new ({', '.join(cols)})")
+        conn.execute(f"INSERT INTO {table}_new SELECT {', '.join(selects)} FROM {table}")
+        conn.execute(f"DROP TABLE {table}")
+        conn.execute(f"ALTER TABLE {table}_new RENAME TO {table}")
+        conn.commit()
+        print(f"Migrated {table} fingerprints from hex TEXT to INTEGER")
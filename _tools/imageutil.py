@@ -0,0 +1,402 @@
+#!/usr/bin/env python3
+"""Shared image decoding and hashing helpers for catalog_images and find_bigger.
+
+Run directly to check that draft-mode hashes stay close to full-decode hashes:
+
+    python3 imageutil.py ../images/big [--tolerance 4]
+"""
+
+import argparse
+import hashlib
+import os
+import struct
+import sys
+import time
+import imagehash
+from PIL import Image
+
+# phash works on a 32x32 grayscale rendition. Asking the JPEG decoder for at
+# least 64x64 lets it use 1/2, 1/4 or 1/8 DCT scaling while leaving enough
+# detail that the resize down to 32x32 barely changes the hash.
+DRAFT_SIZE = 64
+
+# colorhash is 14 bins of this many bits, so it needs its own hex decoding
+COLORHASH_BINBITS = 3
+
+# Bytes of decoded pixels one open_image() call may allocate. Larger images
+# are read at reduced resolution where the format allows it, and skipped
+# otherwise. This replaces Pillow's own decompression-bomb limit, which looks
+# at the full size even when only a reduced copy is decoded.
+MEMORY_BUDGET = 512 * 1024 * 1024
+Image.MAX_IMAGE_PIXELS = None
+
+# TIFF tags used to find reduced-resolution pages and strip sizes
+TIFF_NEWSUBFILETYPE = 254
+TIFF_STRIPBYTECOUNTS = 279
+
+# JPEG start-of-frame markers (C4 DHT, C8 JPG and CC DAC share the range but aren't frames)
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def _jpeg_dimensions(f):
+    f.seek(2)
+    while True:
+        byte = f.read(1)
+        while byte and byte != b"\xff":
+            byte = f.read(1)
+        while byte == b"\xff":  # fill bytes
+            byte = f.read(1)
+        if not byte:
+            raise ValueError("no SOF marker in JPEG")
+        marker = byte[0]
+        if marker == 0x01 or 0xD0 <= marker <= 0xD7:  # TEM / RSTn have no length
+            continue
+        if marker in (0xD9, 0xDA):
+            raise ValueError("no SOF marker before image data")
+        length = struct.unpack(">H", f.read(2))[0]
+        if marker in JPEG_SOF_MARKERS:
+            _precision, h, w = struct.unpack(">BHH", f.read(5))
+            return w, h
+        f.seek(length - 2, os.SEEK_CUR)
+
+
+def _tiff_dimensions(f, order):
+    f.seek(4)
+    offset = struct.unpack(order + "I", f.read(4))[0]
+    f.seek(offset)
+    count = struct.unpack(order + "H", f.read(2))[0]
+    dims = {}
+    for _ in range(count):
+        tag, typ, _n, value = struct.unpack(order + "HHI4s", f.read(12))
+        if tag in (256, 257):  # ImageWidth, ImageLength
+            fmt = "H" if typ == 3 else "I"
+            dims[tag] = struct.unpack_from(order + fmt, value)[0]
+            if len(dims) == 2:
+                return dims[256], dims[257]
+    raise ValueError("TIFF IFD has no width/length")
+
+
+def file_digest(fpath):
+    """SHA-256 hex digest of a file's contents."""
+    h = hashlib.sha256()
+    with open(fpath, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def probe_dimensions(fpath):
+    """Read (width, height) from the JPEG SOF, PNG IHDR or TIFF IFD0 header
+    without decoding any pixel data. Raises ValueError for other formats."""
+    with open(fpath, "rb") as f:
+        head = f.read(24)
+        if head[:2] == b"\xff\xd8":
+            return _jpeg_dimensions(f)
+        if head[:8] == b"\x89PNG\r\n\x1a\n" and head[12:16] == b"IHDR":
+            return struct.unpack(">II", head[16:24])
+        if head[:4] == b"II*\x00":
+            return _tiff_dimensions(f, "<")
+        if head[:4] == b"MM\x00*":
+            return _tiff_dimensions(f, ">")
+    raise ValueError("unrecognised image header")
+
+
+def image_size(fpath):
+    """probe_dimensions(), falling back to Pillow's (still lazy) header parse."""
+    try:
+        return probe_dimensions(fpath)
+    except (ValueError, struct.error):
+        return Image.open(fpath).size
+
+
+class DecodeError(Exception):
+    """An image open_image() refused or failed to decode; reason is a short
+    category for skip reports."""
+
+    def __init__(self, reason, message):
+        super().__init__(message)
+        self.reason = reason
+
+
+def skip_reason(exc):
+    """Short category for an exception raised while reading or decoding an image."""
+    if isinstance(exc, DecodeError):
+        return exc.reason
+    if isinstance(exc, MemoryError):
+        return "out of memory"
+    if isinstance(exc, Image.UnidentifiedImageError):
+        return "not an image"
+    if isinstance(exc, (OSError, SyntaxError)) and "truncated" in str(exc):
+        return "truncated"
+    if isinstance(exc, OSError) and exc.errno is not None:
+        return "read error"
+    return "decode error"
+
+
+def _pixel_bytes(img):
+    """Bytes Pillow allocates per pixel for img's mode."""
+    if img.mode in ("1", "L", "P"):
+        return 1
+    if img.mode.startswith("I;16"):
+        return 2
+    return 4
+
+
+def _tiff_reduced_page(img, target):
+    """Seek to the smallest reduced-resolution copy of the first TIFF page
+    that still covers target on its short side. Later full pages are never
+    looked at."""
+    w, h = img.size
+    best = 0
+    page = 1
+    while True:
+        try:
+            img.seek(page)
+        except EOFError:
+            break
+        if not img.tag_v2.get(TIFF_NEWSUBFILETYPE, 0) & 1:
+            break  # the next page proper, not a reduced copy of this one
+        pw, ph = img.size
+        if min(pw, ph) >= target and abs(pw * h - ph * w) <= max(w, h):
+            best = page
+        page += 1
+    img.seek(best)
+
+
+def _load_strips(img, target, budget):
+    """Decode an uncompressed, stripped TIFF a few strips at a time, shrinking
+    as it goes, so only a reduced copy of the whole image is ever held.
+    Returns None if the file isn't laid out that way."""
+    counts = img.tag_v2.get(TIFF_STRIPBYTECOUNTS)
+    w, h = img.size
+    if (not counts or len(counts) != len(img.tile)
+            or any(t.codec_name != "raw" or t.extents[0] != 0 or t.extents[2] != w for t in img.tile)):
+        return None
+    factor = max(1, min(w, h) // target)
+    rows_needed = max(t.extents[3] - t.extents[1] for t in img.tile) + factor
+    if w * rows_needed * _pixel_bytes(img) > budget:
+        return None
+
+    out = Image.new(img.mode, (-(-w // factor), -(-h // factor)))
+    band = None  # decoded rows not yet reduced
+    y_out = 0
+    for i, (tile, count) in enumerate(zip(img.tile, counts)):
+        x0, y0, x1, y1 = tile.extents
+        img.fp.seek(tile.offset)
+        strip = Image.frombytes(img.mode, (x1 - x0, y1 - y0), img.fp.read(count), "raw", *tile.args)
+        if band is None:
+            band = strip
+        else:
+            joined = Image.new(img.mode, (w, band.height + strip.height))
+            joined.paste(band, (0, 0))
+            joined.paste(strip, (0, band.height))
+            band = joined
+        last = i == len(img.tile) - 1
+        take = band.height if last else band.height - band.height % factor
+        if take:
+            reduced = band.crop((0, 0, w, take)).reduce(factor)
+            out.paste(reduced, (0, y_out))
+            y_out += reduced.height
+            band = band.crop((0, take, w, band.height)) if take < band.height else None
+    return out
+
+
+def open_image(fpath, draft=True, mode="L", budget=MEMORY_BUDGET):
+    """Open and decode an image, returning (img, width, height).
+
+    width/height are always the original dimensions (of the first page, for
+    multi-page TIFFs). With draft set, JPEGs are decoded at the smallest DCT
+    scale that still covers DRAFT_SIZE (in mode, so "L" skips the chroma
+    planes) and TIFFs use a reduced-resolution page when they have one, so
+    img.size can be much smaller than (width, height).
+
+    If the decode would still need more than budget bytes, uncompressed
+    stripped TIFFs are reduced strip by strip; anything else raises
+    DecodeError.
+    """
+    img = Image.open(fpath)
+    w, h = img.size
+    if draft and img.format == "JPEG":
+        img.draft(mode, (DRAFT_SIZE, DRAFT_SIZE))
+    elif draft and img.format == "TIFF":
+        _tiff_reduced_page(img, DRAFT_SIZE)
+
+    if img.size[0] * img.size[1] * _pixel_bytes(img) > budget:
+        reduced = _load_strips(img, DRAFT_SIZE, budget) if img.format == "TIFF" else None
+        if reduced is None:
+            need = img.size[0] * img.size[1] * _pixel_bytes(img)
+            raise DecodeError("over memory budget", f"decoding {img.size[0]}x{img.size[1]} {img.mode} "
+                              f"needs {need >> 20} MB, budget is {budget >> 20} MB")
+        return reduced, w, h
+    img.load()
+    return img, w, h
+
+
+def _whash(img):
+    # A fixed image_scale, otherwise whash would depend on how far the draft
+    # decode happened to shrink the image.
+    return imagehash.whash(img, image_scale=DRAFT_SIZE)
+
+
+def _colorhash(img):
+    return imagehash.colorhash(img, COLORHASH_BINBITS)
+
+
+# Fingerprints we know how to compute, in column order. phash is always
+# computed since it is what find_bigger matches on first.
+HASH_FUNCS = {
+    "phash": imagehash.phash,
+    "dhash": imagehash.dhash,
+    "whash": _whash,
+    "colorhash": _colorhash,
+}
+HASH_NAMES = tuple(HASH_FUNCS)
+
+
+def _center_crop(fraction):
+    def crop(img):
+        w, h = img.size
+        dx = round(w * (1 - fraction) / 2)
+        dy = round(h * (1 - fraction) / 2)
+        return img.crop((dx, dy, w - dx, h - dy))
+    return crop
+
+
+# Transforms of a site image hashed alongside it, so originals that are
+# rotated or mirrored relative to the web version still match
+VARIANTS = {
+    "rot90": lambda img: img.transpose(Image.Transpose.ROTATE_90),
+    "rot180": lambda img: img.transpose(Image.Transpose.ROTATE_180),
+    "rot270": lambda img: img.transpose(Image.Transpose.ROTATE_270),
+    "mirror": lambda img: img.transpose(Image.Transpose.FLIP_LEFT_RIGHT),
+    "flip": lambda img: img.transpose(Image.Transpose.FLIP_TOP_BOTTOM),
+}
+
+# Center crops of a candidate hashed alongside it (the fraction of each side
+# kept), so a web version cropped from a larger original still matches it.
+# Cropping goes on the candidate side: cropping the site image further only
+# moves its hash away from the uncropped original.
+CROPS = {
+    "crop90": 0.9,
+    "crop80": 0.8,
+    "crop70": 0.7,
+}
+
+# Everything fingerprint_variants() can apply, by name
+TRANSFORMS = {**VARIANTS, **{name: _center_crop(fraction) for name, fraction in CROPS.items()}}
+
+
+def parse_hash_names(text):
+    """Parse a --hashes value like "phash,dhash" into a tuple in column order."""
+    names = {n.strip() for n in text.split(",") if n.strip()}
+    unknown = names - set(HASH_NAMES)
+    if unknown:
+        raise argparse.ArgumentTypeError(
+            f"unknown hash {', '.join(sorted(unknown))} (choose from {', '.join(HASH_NAMES)})")
+    names.add("phash")
+    return tuple(n for n in HASH_NAMES if n in names)
+
+
+def hex_to_int(hexstr):
+    """Convert a hex fingerprint (64 bits or fewer) to a signed 64-bit int,
+    which is what SQLite INTEGER columns can hold."""
+    if hexstr is None:
+        return None
+    value = int(hexstr, 16)
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+def hamming(a, b):
+    """Hamming distance between two fingerprints stored as signed 64-bit ints."""
+    if a is None or b is None:
+        return None
+    return ((a ^ b) & 0xFFFFFFFFFFFFFFFF).bit_count()
+
+
+def fingerprint_file(fpath, hashes=("phash",), draft=True, budget=MEMORY_BUDGET, timings=None):
+    """Return (width, height, {name: int}) with every requested hash computed
+    from a single (draft) decode of the file."""
+    w, h, fingerprints, _variants = fingerprint_variants(fpath, hashes, (), draft, budget, timings)
+    return w, h, fingerprints
+
+
+def _fingerprints(img, gray, hashes):
+    return {name: hex_to_int(str(HASH_FUNCS[name](img if name == "colorhash" else gray)))
+            for name in hashes}
+
+
+def fingerprint_variants(fpath, hashes=("phash",), variants=tuple(VARIANTS), draft=True,
+                         budget=MEMORY_BUDGET, timings=None):
+    """Like fingerprint_file(), plus {variant: {name: int}} for each of the
+    named TRANSFORMS (VARIANTS or CROPS), all from the same single decode.
+
+    If a timings dict is given, the seconds spent decoding and hashing are
+    added to its "decode" and "hash" entries.
+    """
+    start = time.perf_counter()
+    color = "colorhash" in hashes
+    img, w, h = open_image(fpath, draft, mode="RGB" if color else "L", budget=budget)
+    gray = img.convert("L")
+    decoded = time.perf_counter()
+    fingerprints = _fingerprints(img, gray, hashes)
+    by_variant = {}
+    for variant in variants:
+        transform = TRANSFORMS[variant]
+        by_variant[variant] = _fingerprints(transform(img) if color else None, transform(gray), hashes)
+    if timings is not None:
+        timings["decode"] = timings.get("decode", 0) + decoded - start
+        timings["hash"] = timings.get("hash", 0) + time.perf_counter() - decoded
+    return w, h, fingerprints, by_variant
+
+
+def phash_file(fpath, draft=True):
+    """Return (width, height, phash) for an image file."""
+    w, h, fingerprints = fingerprint_file(fpath, ("phash",), draft)
+    return w, h, fingerprints["phash"]
+
+
+def check_draft(paths, tolerance=4):
+    """Compare draft and full-decode phashes; return the list of offenders."""
+    dists = []
+    bad = []
+    for fpath in paths:
+        try:
+            full = phash_file(fpath, draft=False)[2]
+            fast = phash_file(fpath, draft=True)[2]
+        except Exception as e:
+            print(f"  SKIP {fpath}: {e}")
+            continue
+        dist = hamming(full, fast)
+        dists.append(dist)
+        if dist > tolerance:
+            bad.append((fpath, dist))
+
+    if dists:
+        print(f"Checked {len(dists)} images: max distance {max(dists)}, "
+              f"mean {sum(dists) / len(dists):.2f} (tolerance {tolerance})")
+    for fpath, dist in bad:
+        print(f"  {dist:<3} {fpath}")
+    return bad
+
+
+def image_files(paths, extensions=(".jpg", ".jpeg", ".png")):
+    """Expand a mix of files and directories into a sorted list of image files."""
+    files = []
+    for p in paths:
+        if os.path.isdir(p):
+            for fname in sorted(os.listdir(p)):
+                if os.path.splitext(fname)[1].lower() in extensions:
+                    files.append(os.path.join(p, fname))
+        else:
+            files.append(p)
+    return files
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check draft-mode phash accuracy.")
+    parser.add_argument("paths", nargs="+", help="image files or directories")
+    parser.add_argument("--tolerance", type=int, default=4,
+                        help="maximum allowed hamming distance from the full decode")
+    args = parser.parse_args()
+
+    sys.exit(1 if check_draft(image_files(args.paths), args.tolerance) else 0)
@@ -1,16 +1,24 @@
 #!/usr/bin/env python3
 """Migrate OTL Studio from PHP/MySQL to static HTML/CSS."""
 
+import argparse
+import contextlib
+import hashlib
+import io
+import json
 import os
 import re
-import glob as globmod
 import shutil
+import sys
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
 
 # Paths
 OLD_SITE = "/Users/colin/Sites/cloudflare/old_otlstudio"
 NEW_SITE = "/Users/colin/Sites/cloudflare/otlstudio"
 CAPTIONS_DIR = os.path.join(OLD_SITE, "captions")
 IMAGES_DIR = os.path.join(NEW_SITE, "images")
+MANIFEST_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "build_manifest.json")
 
 # ============================================================
 # PROJECT DATABASE (scraped from live site)
@@ -74,11 +82,78 @@ PROJECTS = {
 # Sorted project IDs (for next-project navigation)
 SORTED_IDS = sorted(PROJECTS.keys())
 
+
+# ============================================================
+# SITE ASSETS
+# ============================================================
+
+def list_dir(path):
+    """Names in a directory, or none if it doesn't exist."""
+    try:
+        return os.listdir(path)
+    except FileNotFoundError:
+        return []
+
+
+def project_files(old_site):
+    """Sorted IDs of the projects with a PHP page in old_site."""
+    return sorted([
+        f.replace(".php", "") for f in list_dir(os.path.join(old_site, "projects"))
+        if f.endswith(".php") and f != "index.php"
+    ])
+
+
 # Project IDs that have PHP files
-PROJECT_FILES = sorted([
-    f.replace(".php", "") for f in os.listdir(os.path.join(OLD_SITE, "projects"))
-    if f.endswith(".php") and f != "index.php"
-])
+PROJECT_FILES = project_files(OLD_SITE)
+
+
+class SiteAssets:
+    """The images/, images/big/ and captions listings, taken once per run so
+    pages look images and captions up without touching the disk again."""
+
+    def __init__(self, images_dir, captions_dir):
+        self.images = set(list_dir(images_dir))
+        self.big = set(list_dir(os.path.join(images_dir, "big")))
+        self.captions_dir = captions_dir
+        self.captions = {name[:-4] for name in list_dir(captions_dir) if name.endswith(".txt")}
+        self.caption_text = {}
+
+        # Project images are named <project ID><2 characters>.jpg; thumbnails
+        # end in t before the .jpg
+        self.by_project = {}
+        for name in self.images:
+            image_id = name[:-4]
+            if name.endswith(".jpg") and len(name) >= 6 and not image_id.endswith("t"):
+                self.by_project.setdefault(name[:-6], []).append(image_id)
+        for images in self.by_project.values():
+            images.sort()
+
+    def has_big(self, image_id):
+        return f"{image_id}.jpg" in self.big
+
+    def has_thumb(self, image_id):
+        return f"{image_id}t.jpg" in self.images
+
+    def project_files(self, project_id):
+        """Sorted names under images/ (big/ ones prefixed) that start with the project ID."""
+        return sorted([name for name in self.images if name.startswith(project_id)]
+                      + [f"big/{name}" for name in self.big if name.startswith(project_id)])
+
+    def project_images(self, project_id):
+        """Sorted image IDs (non-thumbnail) for a project."""
+        return list(self.by_project.get(project_id, ()))
+
+    def caption(self, image_id):
+        """Caption text for an image ID, read from disk at most once."""
+        if image_id not in self.captions:
+            return ""
+        if image_id not in self.caption_text:
+            path = os.path.join(self.captions_dir, f"{image_id}.txt")
+            self.caption_text[image_id] = open(path).read().strip()
+        return self.caption_text[image_id]
+
+
+ASSETS = SiteAssets(IMAGES_DIR, CAPTIONS_DIR)
 
 
 # ============================================================
@@ -87,24 +162,12 @@ PROJECT_FILES = sorted([
 
 def read_caption(image_id):
     """Read caption text for an image ID (e.g., '19900101')."""
-    path = os.path.join(CAPTIONS_DIR, f"{image_id}.txt")
-    if os.path.exists(path):
-        return open(path).read().strip()
-    return ""
+    return ASSETS.caption(image_id)
 
 
 def get_project_images(project_id):
     """Get sorted list of image IDs for a project (non-thumbnail)."""
-    pattern = os.path.join(IMAGES_DIR, f"{project_id}??.jpg")
-    files = globmod.glob(pattern)
-    # Filter out thumbnails (ending in t.jpg before the number)
-    images = []
-    for f in files:
-        basename = os.path.basename(f).replace(".jpg", "")
-        # Skip thumbnails: they end with 't' before .jpg
-        if not basename.endswith("t"):
-            images.append(basename)
-    return sorted(images)
+    return ASSETS.project_images(project_id)
 
 
 def expand_image_num(project_id, num_str):
@@ -117,16 +180,14 @@ def expand_image_num(project_id, num_str):
 
 def get_image_src(image_id):
     """Get the best available image source path (prefer big/ version)."""
-    big_path = os.path.join(IMAGES_DIR, "big", f"{image_id}.jpg")
-    if os.path.exists(big_path):
+    if ASSETS.has_big(image_id):
         return f"../images/big/{image_id}.jpg"
     return f"../images/{image_id}.jpg"
 
 
 def get_thumb_src(image_id):
     """Get thumbnail source path."""
-    thumb_path = os.path.join(IMAGES_DIR, f"{image_id}t.jpg")
-    if os.path.exists(thumb_path):
+    if ASSETS.has_thumb(image_id):
         return f"../images/{image_id}t.jpg"
     return f"../images/{image_id}.jpg"
 
@@ -144,10 +205,44 @@ def html_escape(text):
     return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
 
 
+# ============================================================
+# OUTPUT
+# ============================================================
+
+# Generated files this process wrote, left alone because they were already
+# identical, and removed as stale
+OUTPUT_COUNTS = Counter()
+
+
+def sha256_file(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def write_output(out_path, html):
+    """Write a generated page, unless the file already holds exactly this
+    content (then it and its mtime are left alone, so deploys only upload
+    real changes). The content goes to a temporary file that is renamed over
+    out_path, so an interrupted run never leaves a truncated page."""
+    data = html.encode("utf-8")
+    if (os.path.exists(out_path) and os.path.getsize(out_path) == len(data)
+            and sha256_file(out_path) == hashlib.sha256(data).hexdigest()):
+        OUTPUT_COUNTS["unchanged"] += 1
+        return
+    tmp_path = out_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, out_path)
+    OUTPUT_COUNTS["written"] += 1
+
+
 # ============================================================
 # HTML TEMPLATE
 # ============================================================
 
+# Bump when html_template() changes, so incremental builds redo every page
+TEMPLATE_VERSION = 1
+
 def html_template(title, content, section="", depth=0):
     """Wrap content in the site HTML template."""
     rel = "../" * depth if depth > 0 else ""
@@ -246,53 +341,88 @@ def generate_gallery(project_id, images):
 # PHP CONVERSION
 # ============================================================
 
-def convert_php_content(text, project_id=None):
-    """Convert PHP function calls in content to static HTML."""
-
-    # Remove PHP include lines
-    text = re.sub(
-        r'<\?php\s+include\s*\([^)]+\)\s*;?\s*\?>',
-        '', text, flags=re.IGNORECASE
-    )
+# PHP include lines, then HTML comments with project names (<!-- The Slammer -->),
+# are dropped first, each in its own pass
+PHP_INCLUDE = re.compile(r'<\?php\s+include\s*\([^)]+\)\s*;?\s*\?>', re.IGNORECASE)
+HTML_COMMENT = re.compile(r'<!--[^>]*-->')
+
+# The PHP tags convert_php_content() rewrites, as (name, pattern) in priority
+# order: where two could match at the same place, the earlier one wins, as
+# when each was a separate pass over the page in this order.
+PHP_TAGS = [
+    # projectHeading, alone or after photoTop/photoSide (handled separately in project pages)
+    ("heading", r'(?-i:<\?php\s+echo\s*\(\s*(?:photo(?:Top|Side)\s*\([^)]+\)\s*\.\s*)?'
+                r'project[Hh]eading\s*\(\s*\)\s*\)\s*;?\s*\?>)'),
+    ("photo_top", r'(?i:<\?php\s+echo\s*\(\s*photoTop\s*\((?P<top_args>[^)]+)\)\s*\)\s*;?\s*\?>)'),
+    ("photo_side", r'(?i:<\?php\s+echo\s*\(\s*photoSide\s*\((?P<side_args>[^)]+)\)\s*\)\s*;?\s*\?>)'),
+    ("photo_bar", r'(?i:<\?php\s+echo\s*\(?photo[Bb]ar\s*\((?P<bar_args>[^)]+)\)\s*\)?\s*;?\s*\?>)'),
+    # projectlink(id) or projectlink(id, "name")
+    ("projectlink", r'(?i:<\?php\s+echo\s*\(\s*projectlink\s*\(\s*(?P<link_id>\d+)\s*'
+                    r'(?:,\s*"(?P<link_name>[^"]*?)"\s*)?\)\s*\)\s*;?\s*\?>)'),
+    # projectList (used on Slammer page)
+    ("project_list", r'(?i:<\?php\s+echo\s*\(\s*projectList\s*\(\s*"(?P<list_where>[^"]+)"\s*\)\s*\)\s*;?\s*\?>)'),
+]
+
+# Any other PHP tag left once those are converted is dropped
+PHP_REST = re.compile(r'<\?php[^?]*\?>', re.IGNORECASE)
+
+# The links it rewrites once the tags are gone (a tag between "contact" and
+# ".php", or in front of "images/", joins them into a link)
+LINKS = [
+    # Relative image paths (for non-project pages): images/ is now _Media/, /images/ is images/
+    ("src", r'src="?(?P<src_root>/?)images/'),
+    # gallery.php links to lightbox anchors
+    ("gallery", r'<a href=["\']?(?:http://otlstudio\.com)?/gallery\.php\?image=(?P<gallery_image>\w+)["\']?>'),
+    # Absolute /projects/ links
+    ("project_href", r'href=/projects/(?P<project_page>\d+)\.html">'),
+    # Old-style links
+    ("page_href", r'href=/(?P<page>projects|mission|about|contact|journal|mission/generating|mission/plan)\.php'),
+    ("code_href", r'href=/code/'),
+    ("php_href", r'\.php[">]'),
+]
+
+
+def token_pattern(start, tokens):
+    """One regex matching any of tokens, each in a group named for it.
+
+    Every token starts with start; checking that first lets the scan pass
+    over plain text without trying each alternative at every character.
+    """
+    return re.compile(start + "(?:" + "|".join(f"(?P<{name}>{pattern})" for name, pattern in tokens) + ")")
+
+
+PHP_TAG_TOKEN = token_pattern(r'(?=<\?)', PHP_TAGS)
+LINK_TOKEN = token_pattern(r'(?=[<s.h])(?=<a|sr|hr|\.p)', LINKS)
+
+
+def photo_ids(project_id, args):
+    """Image IDs for the photo numbers in a photoTop/photoSide/photoBar call."""
+    args = [a.strip().strip('"').strip("'") for a in args.split(",")]
+    return [expand_image_num(project_id, a) for a in args if a]
 
-    # Remove HTML comments with project names (<!-- The Slammer -->)
-    text = re.sub(r'<!--[^>]*-->', '', text)
 
-    # Convert photoTop + projectHeading (handled separately in project pages)
-    text = re.sub(
-        r'<\?php\s+echo\s*\(\s*photo(?:Top|Side)\s*\([^)]+\)\s*\.\s*project[Hh]eading\s*\(\s*\)\s*\)\s*;?\s*\?>',
-        '%%PROJECT_HEADING%%', text
-    )
+def convert_php_content(text, project_id=None):
+    """Convert PHP function calls in content to static HTML.
 
-    # Convert standalone projectHeading
-    text = re.sub(
-        r'<\?php\s+echo\s*\(\s*project[Hh]eading\s*\(\s*\)\s*\)\s*;?\s*\?>',
-        '%%PROJECT_HEADING%%', text
-    )
+    Includes and comments are dropped first, then one scan converts PHP_TAGS
+    and another drops any PHP_REST, and a last scan rewrites LINKS. Each token
+    match goes to its handler below.
+    """
 
-    # Convert photoTop (standalone, without projectHeading)
     def replace_photo_top(m):
-        args = [a.strip().strip('"').strip("'") for a in m.group(1).split(",")]
         if not project_id:
             return ""
-        imgs = [expand_image_num(project_id, a) for a in args if a]
+        imgs = photo_ids(project_id, m.group("top_args"))
         if not imgs:
             return ""
         hero_src = get_image_src(imgs[0])
         html = f'<div class="project-hero"><img src="{hero_src}" alt="" /></div>\n'
         return html
 
-    text = re.sub(
-        r'<\?php\s+echo\s*\(\s*photoTop\s*\(([^)]+)\)\s*\)\s*;?\s*\?>',
-        replace_photo_top, text, flags=re.IGNORECASE
-    )
-
-    # Convert photoSide (standalone)
     def replace_photo_side(m):
-        args = [a.strip().strip('"').strip("'") for a in m.group(1).split(",")]
         if not project_id:
             return ""
-        imgs = [expand_image_num(project_id, a) for a in args if a]
+        imgs = photo_ids(project_id, m.group("side_args"))
         if not imgs:
             return ""
         main_src = get_image_src(imgs[0])
@@ -305,17 +435,10 @@ def convert_php_content(text, project_id=None):
         html += '</div>\n'
         return html
 
-    text = re.sub(
-        r'<\?php\s+echo\s*\(\s*photoSide\s*\(([^)]+)\)\s*\)\s*;?\s*\?>',
-        replace_photo_side, text, flags=re.IGNORECASE
-    )
-
-    # Convert photoBar
     def replace_photo_bar(m):
-        args = [a.strip().strip('"').strip("'") for a in m.group(1).split(",")]
         if not project_id:
             return ""
-        imgs = [expand_image_num(project_id, a) for a in args if a]
+        imgs = photo_ids(project_id, m.group("bar_args"))
         if not imgs:
             return ""
         html = '<div class="photo-bar">\n'
@@ -324,37 +447,18 @@ def convert_php_content(text, project_id=None):
         html += '</div>\n'
         return html
 
-    text = re.sub(
-        r'<\?php\s+echo\s*\(?photo[Bb]ar\s*\(([^)]+)\)\s*\)?\s*;?\s*\?>',
-        replace_photo_bar, text, flags=re.IGNORECASE
-    )
-
-    # Convert projectlink
     def replace_projectlink(m):
-        pid = m.group(1).strip()
-        name = m.group(2)
+        pid = m.group("link_id").strip()
+        name = m.group("link_name")
         if name:
             name = name.strip().strip('"').strip("'")
         else:
             name = PROJECTS.get(pid, {}).get("name", pid)
         return f'<a href="../projects/{pid}.html">{name}</a>'
 
-    # projectlink with name argument
-    text = re.sub(
-        r'<\?php\s+echo\s*\(\s*projectlink\s*\(\s*(\d+)\s*,\s*"([^"]*?)"\s*\)\s*\)\s*;?\s*\?>',
-        replace_projectlink, text, flags=re.IGNORECASE
-    )
-    # projectlink without name
-    text = re.sub(
-        r'<\?php\s+echo\s*\(\s*projectlink\s*\(\s*(\d+)\s*\)\s*\)\s*;?\s*\?>',
-        lambda m: replace_projectlink(type('M', (), {'group': lambda s, n: m.group(n) if n <= 1 else None})()), text, flags=re.IGNORECASE
-    )
-
-    # Convert projectList (used on Slammer page)
     def replace_project_list(m):
-        where_clause = m.group(1)
         # Parse the IN clause for project IDs
-        ids = re.findall(r"'(\d+)'", where_clause)
+        ids = re.findall(r"'(\d+)'", m.group("list_where"))
         html = '<table class="project-list">\n<tr><th>Project</th><th>Location</th></tr>\n'
         for pid in ids:
             proj = PROJECTS.get(pid, {})
@@ -370,42 +474,26 @@ def convert_php_content(text, project_id=None):
         html += '</table>\n'
         return html
 
-    text = re.sub(
-        r'<\?php\s+echo\s*\(\s*projectList\s*\(\s*"([^"]+)"\s*\)\s*\)\s*;?\s*\?>',
-        replace_project_list, text, flags=re.IGNORECASE
-    )
-
-    # Remove any remaining PHP tags
-    text = re.sub(r'<\?php[^?]*\?>', '', text, flags=re.IGNORECASE | re.DOTALL)
-
-    # Fix relative image paths (for non-project pages)
-    text = text.replace('src=images/', 'src="_Media/')
-    text = text.replace('src="images/', 'src="_Media/')
-    text = text.replace('src=/images/', 'src="images/')
-    text = text.replace('src="/images/', 'src="images/')
-
-    # Fix gallery.php links to lightbox anchors
-    text = re.sub(
-        r'<a href=["\']?(?:http://otlstudio\.com)?/gallery\.php\?image=(\w+)["\']?>',
-        lambda m: f'<a href="#img-{m.group(1)}">',
-        text
-    )
-
-    # Fix absolute /projects/ links
-    text = re.sub(r'href=/projects/(\d+)\.html">', r'href="\1.html">', text)
-
-    # Fix old-style links
-    text = text.replace('href=/projects.php', 'href="projects.html"')
-    text = text.replace('href=/mission.php', 'href="mission.html"')
-    text = text.replace('href=/about.php', 'href="about.html"')
-    text = text.replace('href=/contact.php', 'href="contact.html"')
-    text = text.replace('href=/journal.php', 'href="journal.html"')
-    text = text.replace('href=/code/', 'href="code/index.html"')
-    text = text.replace('href=/mission/generating.php', 'href="mission/generating.html"')
-    text = text.replace('href=/mission/plan.php', 'href="mission/plan.html"')
-    text = text.replace('.php"', '.html"')
-    text = text.replace(".php>", '.html">')
-
+    handlers = {
+        "heading": lambda m: "%%PROJECT_HEADING%%",
+        "photo_top": replace_photo_top,
+        "photo_side": replace_photo_side,
+        "photo_bar": replace_photo_bar,
+        "projectlink": replace_projectlink,
+        "project_list": replace_project_list,
+        "src": lambda m: 'src="images/' if m.group("src_root") else 'src="_Media/',
+        "gallery": lambda m: f'<a href="#img-{m.group("gallery_image")}">',
+        "project_href": lambda m: f'href="{m.group("project_page")}.html">',
+        "page_href": lambda m: f'href="{m.group("page")}.html"',
+        "code_href": lambda m: 'href="code/index.html"',
+        "php_href": lambda m: '.html"' if m.group() == '.php"' else '.html">',
+    }
+
+    text = PHP_INCLUDE.sub("", text)
+    text = HTML_COMMENT.sub("", text)
+    text = PHP_TAG_TOKEN.sub(lambda m: handlers[m.lastgroup](m), text)
+    text = PHP_REST.sub("", text)
+    text = LINK_TOKEN.sub(lambda m: handlers[m.lastgroup](m), text)
     return text.strip()
 
 
@@ -484,7 +572,7 @@ def convert_project_page(project_id):
 
     html = html_template(name, full_content, "projects", depth=1)
     out_path = os.path.join(NEW_SITE, "projects", f"{project_id}.html")
-    open(out_path, "w").write(html)
+    write_output(out_path, html)
     print(f"  {project_id}.html - {name} ({len(images)} images)")
 
 
@@ -519,7 +607,7 @@ def convert_content_page(php_filename, output_filename, section, title, depth=0)
     html = html_template(title, full_content, section, depth=depth)
     out_path = os.path.join(NEW_SITE, output_filename)
     os.makedirs(os.path.dirname(out_path), exist_ok=True)
-    open(out_path, "w").write(html)
+    write_output(out_path, html)
     print(f"  {output_filename}")
 
 
@@ -562,7 +650,7 @@ def generate_homepage():
 
     html = html_template("Home", content, "", depth=0)
     out_path = os.path.join(NEW_SITE, "index.html")
-    open(out_path, "w").write(html)
+    write_output(out_path, html)
     print("  index.html")
 
 
@@ -650,7 +738,7 @@ def generate_projects_index():
     content = f"    {grid_html}\n{intro_html}\n{table_html}\n{timeline_html}"
     html = html_template("Projects", content, "projects", depth=0)
     out_path = os.path.join(NEW_SITE, "projects.html")
-    open(out_path, "w").write(html)
+    write_output(out_path, html)
     print("  projects.html")
 
 
@@ -721,7 +809,7 @@ def generate_mission():
 
     html = html_template("Mission", content, "mission", depth=0)
     out_path = os.path.join(NEW_SITE, "mission.html")
-    open(out_path, "w").write(html)
+    write_output(out_path, html)
     print("  mission.html")
 
 
@@ -778,7 +866,7 @@ def generate_about():
 
     html = html_template("About", content, "about", depth=0)
     out_path = os.path.join(NEW_SITE, "about.html")
-    open(out_path, "w").write(html)
+    write_output(out_path, html)
     print("  about.html")
 
 
@@ -842,7 +930,7 @@ def generate_journal():
 
     html = html_template("Journal", content, "journal", depth=0)
     out_path = os.path.join(NEW_SITE, "journal.html")
-    open(out_path, "w").write(html)
+    write_output(out_path, html)
     print("  journal.html")
 
 
@@ -858,7 +946,7 @@ def generate_contact():
 
     html = html_template("Contact", content, "contact", depth=0)
     out_path = os.path.join(NEW_SITE, "contact.html")
-    open(out_path, "w").write(html)
+    write_output(out_path, html)
     print("  contact.html")
 
 
@@ -946,7 +1034,7 @@ def generate_code_index():
 
     html = html_template("Code", content, "about", depth=1)
     out_path = os.path.join(NEW_SITE, "code", "index.html")
-    open(out_path, "w").write(html)
+    write_output(out_path, html)
     print("  code/index.html")
 
 
@@ -995,7 +1083,7 @@ def generate_code_jungle():
 
     html = html_template("The Jungle", content, "about", depth=1)
     out_path = os.path.join(NEW_SITE, "code", "jungle.html")
-    open(out_path, "w").write(html)
+    write_output(out_path, html)
     print("  code/jungle.html")
 
 
@@ -1085,7 +1173,7 @@ def generate_code_tightcircle():
 
     html = html_template("tightcircle", content, "about", depth=1)
     out_path = os.path.join(NEW_SITE, "code", "tightcircle.html")
-    open(out_path, "w").write(html)
+    write_output(out_path, html)
     print("  code/tightcircle.html")
 
 
@@ -1177,7 +1265,7 @@ def generate_mission_generating():
 
     html = html_template("A Generating Geometry", content, "mission", depth=1)
     out_path = os.path.join(NEW_SITE, "mission", "generating.html")
-    open(out_path, "w").write(html)
+    write_output(out_path, html)
     print("  mission/generating.html")
 
 
@@ -1245,37 +1333,173 @@ def generate_mission_plan():
 
     html = html_template("Plan Obsession", content, "mission", depth=1)
     out_path = os.path.join(NEW_SITE, "mission", "plan.html")
-    open(out_path, "w").write(html)
+    write_output(out_path, html)
     print("  mission/plan.html")
 
 
+# ============================================================
+# INCREMENTAL BUILD
+# ============================================================
+
+# Content pages (output path, generator), in the order main() runs them
+CONTENT_PAGES = [
+    ("index.html", generate_homepage),
+    ("mission.html", generate_mission),
+    ("mission/generating.html", generate_mission_generating),
+    ("mission/plan.html", generate_mission_plan),
+    ("about.html", generate_about),
+    ("journal.html", generate_journal),
+    ("contact.html", generate_contact),
+    ("projects.html", generate_projects_index),
+    ("code/index.html", generate_code_index),
+    ("code/jungle.html", generate_code_jungle),
+    ("code/tightcircle.html", generate_code_tightcircle),
+]
+
+
+def content_inputs(output, generator):
+    """What a content page depends on: the generator itself, plus the project
+    list for projects.html."""
+    inputs = {"generator": generator, "template": TEMPLATE_VERSION}
+    if output == "projects.html":
+        inputs["projects"] = PROJECTS
+        inputs["project_files"] = PROJECT_FILES
+    return inputs
+
+
+def project_inputs(project_id, generator):
+    """What a project page depends on: the generator, its PHP source, its
+    images and big/ variants, their captions, and the PROJECTS entries (and
+    whether they have pages) of itself, the next project and any project
+    its source mentions."""
+    php_path = os.path.join(OLD_SITE, "projects", f"{project_id}.php")
+    raw = open(php_path, encoding="latin-1").read()
+    mentioned = {project_id, next_project(project_id)} | set(re.findall(r"\d+", raw))
+    return {
+        "generator": generator,
+        "template": TEMPLATE_VERSION,
+        "source": hashlib.sha256(raw.encode("latin-1")).hexdigest(),
+        "images": ASSETS.project_files(project_id),
+        "captions": {image_id: hashlib.sha256(read_caption(image_id).encode()).hexdigest()
+                     for image_id in get_project_images(project_id) if image_id in ASSETS.captions},
+        "projects": {pid: [PROJECTS[pid], pid in PROJECT_FILES] for pid in sorted(mentioned) if pid in PROJECTS},
+        "next": next_project(project_id),
+    }
+
+
+def load_manifest():
+    """{output path: inputs} from the last build of NEW_SITE, or {}."""
+    try:
+        with open(MANIFEST_PATH) as f:
+            manifest = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+    return manifest["pages"] if manifest.get("site") == NEW_SITE else {}
+
+
+def save_manifest(pages):
+    tmp_path = MANIFEST_PATH + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"site": NEW_SITE, "pages": pages}, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, MANIFEST_PATH)
+
+
 # ============================================================
 # MAIN
 # ============================================================
 
-def main():
+
+
+def render_page(task):
+    """Run one (function, args) page task and return what it printed and
+    what it added to OUTPUT_COUNTS."""
+    func, args = task
+    before = OUTPUT_COUNTS.copy()
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        func(*args)
+    return out.getvalue(), OUTPUT_COUNTS - before
+
+
+def run_pages(tasks, jobs=1):
+    """Run (function, args) page tasks and yield, in task order, what each
+    printed and its OUTPUT_COUNTS (with jobs == 1 they print and count as
+    they go and yield nothing to add)."""
+    if jobs <= 1:
+        for func, args in tasks:
+            func(*args)
+            yield "", Counter()
+        return
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        yield from pool.map(render_page, tasks)
+
+
+def replay(pages, count):
+    """Print the output of the next count pages and add up their counts."""
+    for _ in range(count):
+        text, counts = next(pages)
+        sys.stdout.write(text)
+        OUTPUT_COUNTS.update(counts)
+
+
+def main(jobs=1, force=False):
     print("OTL Studio Migration")
     print("=" * 50)
 
+    # Pages whose recorded inputs still match (and whose file is still there)
+    # are skipped unless force is set. The manifest is loaded either way: it
+    # is also what tells which outputs no page makes any more.
+    manifest = load_manifest()
+    generator = sha256_file(os.path.abspath(__file__))
+    content = [(output, func, (), content_inputs(output, generator)) for output, func in CONTENT_PAGES]
+    projects = [(f"projects/{pid}.html", convert_project_page, (pid,), project_inputs(pid, generator))
+                for pid in PROJECT_FILES]
+
+    def stale(page):
+        output, _func, _args, inputs = page
+        return (force or manifest.get(output) != inputs
+                or not os.path.exists(os.path.join(NEW_SITE, output)))
+
+    content_todo = [page for page in content if stale(page)]
+    projects_todo = [page for page in projects if stale(page)]
+
+    # One pool for both sections; output is replayed in order, so it reads
+    # the same as a serial run
+    pages = run_pages([(func, args) for _output, func, args, _inputs in content_todo + projects_todo], jobs)
+
     print("\nGenerating content pages...")
-    generate_homepage()
-    generate_mission()
-    generate_mission_generating()
-    generate_mission_plan()
-    generate_about()
-    generate_journal()
-    generate_contact()
-    generate_projects_index()
-    generate_code_index()
-    generate_code_jungle()
-    generate_code_tightcircle()
+    replay(pages, len(content_todo))
 
     print(f"\nGenerating {len(PROJECT_FILES)} project pages...")
-    for pid in PROJECT_FILES:
-        convert_project_page(pid)
+    replay(pages, len(projects_todo))
+
+    skipped = len(content) + len(projects) - len(content_todo) - len(projects_todo)
+    if skipped:
+        print(f"\n{skipped} pages skipped, inputs unchanged since the last build")
+
+    # Outputs of the last build that nothing generates any more (say, a
+    # project whose PHP source was deleted)
+    current = {output: inputs for output, _func, _args, inputs in content + projects}
+    for output in sorted(set(manifest) - set(current)):
+        try:
+            os.remove(os.path.join(NEW_SITE, output))
+        except FileNotFoundError:
+            continue
+        OUTPUT_COUNTS["removed"] += 1
+        print(f"  removed {output}")
+    save_manifest(current)
+
+    print(f"\nFiles: {OUTPUT_COUNTS['written']} written, {OUTPUT_COUNTS['unchanged']} unchanged, "
+          f"{OUTPUT_COUNTS['removed']} removed")
 
     print(f"\nDone! Generated files in {NEW_SITE}")
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--jobs", "-j", type=int, default=1,
+                        help="worker processes generating pages (0 = one per core)")
+    parser.add_argument("--force", action="store_true",
+                        help="regenerate every page, even ones whose inputs haven't changed")
+    args = parser.parse_args()
+    main(jobs=args.jobs or os.cpu_count() or 1, force=args.force)
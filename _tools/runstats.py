@@ -0,0 +1,132 @@
+"""Timing, throughput and memory figures for catalog_images and find_bigger runs.
+
+Stage times are summed over every thread and worker process doing that
+stage, so with --jobs 8 the decode figure can exceed the wall-clock time.
+Compare each stage against the workers it had: read time close to
+io_threads x elapsed means the scan is disk-bound, decode + hash close to
+jobs x elapsed means it is CPU-bound.
+"""
+
+import json
+import resource
+import sys
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+STAGES = ("walk", "read", "decode", "hash", "db_write", "match")
+
+
+def peak_rss_mb(who=resource.RUSAGE_SELF):
+    """Peak resident set size in MB (ru_maxrss is bytes on macOS, KB elsewhere)."""
+    rss = resource.getrusage(who).ru_maxrss
+    return rss / (1 << 20) if sys.platform == "darwin" else rss / 1024
+
+
+def format_duration(seconds):
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}h{seconds % 3600 // 60:02d}m"
+    if seconds >= 60:
+        return f"{seconds // 60}m{seconds % 60:02d}s"
+    return f"{seconds}s"
+
+
+class RunStats:
+    """Collect stage timings and counts for one run.
+
+    With progress_interval (seconds), advance() prints a progress line with
+    rates and an ETA at most that often, once total is known.
+    """
+
+    def __init__(self, tool, progress_interval=None):
+        self.tool = tool
+        self.progress_interval = progress_interval
+        self.started = time.perf_counter()
+        self.stages = defaultdict(float)
+        self.workers = {}
+        self.images = 0
+        self.bytes = 0
+        self.skipped = Counter()
+        self.total = None
+        self._last_progress = self.started
+        self._current = None
+
+    @contextmanager
+    def stage(self, name):
+        """Time a block as stage name. Time in a stage nested inside it (or
+        passed to took()) is not also counted for the outer one."""
+        outer, self._current = self._current, name
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._current = outer
+            self.took(name, time.perf_counter() - start)
+
+    def took(self, name, seconds):
+        """Count seconds measured inside the current stage as name instead."""
+        self.stages[name] += seconds
+        if self._current is not None:
+            self.stages[self._current] -= seconds
+
+    def add(self, timings):
+        """Add {stage: seconds} measured elsewhere (say, in a worker process)."""
+        for name, seconds in timings.items():
+            self.stages[name] += seconds
+
+    def advance(self, nbytes=0, skipped=None):
+        """Count one file as processed (or skipped, with a reason)."""
+        if skipped is None:
+            self.images += 1
+            self.bytes += nbytes
+        else:
+            self.skipped[skipped] += 1
+        if self.progress_interval is not None and self.total:
+            now = time.perf_counter()
+            if now - self._last_progress >= self.progress_interval:
+                self._last_progress = now
+                self.print_progress(now)
+
+    def print_progress(self, now):
+        done = self.images + self.skipped.total()
+        elapsed = now - self.started
+        rate = done / elapsed if elapsed else 0
+        eta = format_duration((self.total - done) / rate) if rate else "?"
+        print(f"  {done}/{self.total} images, {rate:.1f} images/s, "
+              f"{self.bytes / (1 << 20) / elapsed:.1f} MB/s, ETA {eta}", flush=True)
+
+    def summary(self):
+        elapsed = time.perf_counter() - self.started
+        return {
+            "tool": self.tool,
+            "elapsed_s": round(elapsed, 3),
+            "stages_s": {name: round(self.stages[name], 3) for name in STAGES if name in self.stages},
+            "workers": self.workers,
+            "images": self.images,
+            "megabytes": round(self.bytes / (1 << 20), 1),
+            "images_per_s": round(self.images / elapsed, 2) if elapsed else None,
+            "mb_per_s": round(self.bytes / (1 << 20) / elapsed, 2) if elapsed else None,
+            "skipped": dict(self.skipped.most_common()),
+            "peak_rss_mb": round(peak_rss_mb(), 1),
+            "peak_worker_rss_mb": round(peak_rss_mb(resource.RUSAGE_CHILDREN), 1),
+        }
+
+    def report(self, json_path=None):
+        """Print a one-paragraph summary; with json_path also write summary()
+        there as JSON ("-" for stdout)."""
+        summary = self.summary()
+        stages = ", ".join(f"{name} {seconds:.1f}s" for name, seconds in summary["stages_s"].items())
+        print(f"\n{summary['images']} images ({summary['megabytes']} MB) in "
+              f"{format_duration(summary['elapsed_s'])}: {summary['images_per_s']} images/s, "
+              f"{summary['mb_per_s']} MB/s")
+        if stages:
+            workers = ", ".join(f"{n} {name}" for name, n in self.workers.items())
+            print(f"  stage time: {stages}" + (f" ({workers})" if workers else ""))
+        print(f"  peak RSS {summary['peak_rss_mb']} MB, largest worker {summary['peak_worker_rss_mb']} MB")
+        if json_path == "-":
+            print(json.dumps(summary, indent=2))
+        elif json_path:
+            with open(json_path, "w") as f:
+                json.dump(summary, f, indent=2)
+                f.write("\n")
@@ -0,0 +1,160 @@
+"""Overlapped read / decode pipeline for scanning candidate images.
+
+Reader threads prefetch whole files (computing the content digest on the way),
+a process pool decodes and hashes the bytes, and the caller consumes results
+in the original order. The bytes held in flight are capped, so a slow disk and
+busy cores keep each other fed without the queue growing without bound. Files
+too big to be worth holding in memory are opened by the decoder itself, so it
+only reads the pages or strips it actually decodes.
+"""
+
+import hashlib
+import io
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from imageutil import MEMORY_BUDGET, file_digest, fingerprint_variants, skip_reason
+
+# Upper bound on file bytes read but not yet hashed
+MAX_INFLIGHT_BYTES = 256 * 1024 * 1024
+
+# Files at least this big are not prefetched (see above)
+STREAM_MIN_SIZE = 64 * 1024 * 1024
+
+
+def read_file(fpath, digest=False, prefetch=True):
+    """Read a whole file; returns (data, sha256 hex or None). Without prefetch
+    data is None and the digest (if any) is computed a chunk at a time."""
+    if not prefetch:
+        return None, file_digest(fpath) if digest else None
+    with open(fpath, "rb") as f:
+        data = f.read()
+    return data, hashlib.sha256(data).hexdigest() if digest else None
+
+
+def hash_bytes(data, hashes, budget=MEMORY_BUDGET, timings=None, variants=()):
+    """Decode and fingerprint an image held in memory (or, if data is a path,
+    on disk), and each of the named variants of it; runs in pool workers.
+
+    Returns (width, height, fingerprints, variant fingerprints, error), where
+    error is None or a (reason, message) pair.
+    """
+    try:
+        return (*fingerprint_variants(io.BytesIO(data) if isinstance(data, bytes) else data,
+                                      hashes, variants, budget=budget, timings=timings), None)
+    except Exception as e:
+        return None, None, None, None, (skip_reason(e), str(e))
+
+
+def _timed_read(fpath, digest, prefetch):
+    start = time.perf_counter()
+    data, sha = read_file(fpath, digest, prefetch)
+    return data, sha, time.perf_counter() - start
+
+
+def _timed_hash(data, hashes, budget, variants):
+    timings = {}
+    return hash_bytes(data, hashes, budget, timings, variants), timings
+
+
+def _done(value):
+    fut = Future()
+    fut.set_result(value)
+    return fut
+
+
+class _Entry:
+    __slots__ = ("item", "size", "read", "digest", "decode")
+
+    def __init__(self, item, size, read):
+        self.item = item
+        self.size = size
+        self.read = read
+        self.digest = None
+        self.decode = None
+
+
+def scan(items, hashes, triage=None, digest=False, jobs=1, io_threads=4,
+         max_bytes=MAX_INFLIGHT_BYTES, budget=MEMORY_BUDGET, stats=None, variants=()):
+    """Read and hash (path, size, ...) tuples, yielding (item, digest, result)
+    in input order.
+
+    result is hash_bytes()'s tuple, or None when triage(item, digest) returned
+    False and the file was not decoded. digest is True to digest every file
+    as it is read, or a predicate picking the items to digest. Read errors
+    come back as a result with the error set. variants names
+    imageutil.TRANSFORMS to fingerprint from the same decode. budget is the
+    decode memory budget for each worker. Read, decode and hash times are
+    added to stats (a runstats.RunStats) if given.
+    """
+    decoder = ProcessPoolExecutor(max_workers=jobs) if jobs > 1 else None
+    wants_digest = digest if callable(digest) else lambda item: digest
+    max_items = max(8, 4 * max(jobs, io_threads))
+    pending = deque()
+    inflight = 0
+    next_item = 0
+
+    def promote(entry):
+        # Runs in input order, so triage decisions (e.g. which copy claims a
+        # moved row) don't depend on which read finished first.
+        try:
+            data, entry.digest, seconds = entry.read.result()
+        except OSError as e:
+            entry.decode = _done(((None, None, None, None, (skip_reason(e), str(e))), {}))
+            return
+        if stats is not None:
+            stats.add({"read": seconds})
+        entry.read = None
+        if data is None:
+            data = entry.item[0]
+        if triage is not None and not triage(entry.item, entry.digest):
+            entry.decode = _done((None, {}))
+        elif decoder is not None:
+            entry.decode = decoder.submit(_timed_hash, data, hashes, budget, variants)
+        else:
+            entry.decode = _done(_timed_hash(data, hashes, budget, variants))
+
+    try:
+        with ThreadPoolExecutor(max_workers=io_threads) as reader:
+            while next_item < len(items) or pending:
+                # Keep reads queued up to the byte/item budget (always at least one)
+                while next_item < len(items) and (
+                        not pending
+                        or (len(pending) < max_items and inflight + items[next_item][1] <= max_bytes)):
+                    item = items[next_item]
+                    next_item += 1
+                    prefetch = item[1] < STREAM_MIN_SIZE
+                    size = item[1] if prefetch else 0
+                    inflight += size
+                    read = reader.submit(_timed_read, item[0], wants_digest(item), prefetch)
+                    pending.append(_Entry(item, size, read))
+
+                # Hand finished reads to the decoder, in order, until the
+                # oldest item is done
+                head = pending[0]
+                while True:
+                    blocking = None
+                    for entry in pending:
+                        if entry.decode is None:
+                            if not entry.read.done():
+                                blocking = entry.read
+                                break
+                            promote(entry)
+                    if head.decode is not None and head.decode.done():
+                        break
+                    # Only the first unfinished read holds up promotion; reads
+                    # already done behind it would make wait() return at once
+                    waiting = [blocking] if blocking is not None else []
+                    if head.decode is not None:
+                        waiting.append(head.decode)
+                    wait(waiting, return_when=FIRST_COMPLETED)
+
+                pending.popleft()
+                result, timings = head.decode.result()
+                if stats is not None:
+                    stats.add(timings)
+                inflight -= head.size
+                yield head.item, head.digest, result
+    finally:
+        if decoder is not None:
+            decoder.shutdown(cancel_futures=True)
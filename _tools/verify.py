@@ -0,0 +1,87 @@
+"""Cheap geometric check of a fingerprint match on small grayscale renditions.
+
+A site image is normally its original scaled down, and possibly cropped. The
+check shrinks the site rendition to a few fractions of the candidate's size,
+slides it over every position in the candidate rendition, and keeps the best
+normalized cross-correlation: about 1.0 when the pixels line up, around 0 for
+images that only share a fingerprint.
+"""
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from PIL import Image
+from imageutil import MEMORY_BUDGET, open_image
+
+# Long side of the renditions compared, in pixels
+RENDITION_SIZE = 64
+
+# Fractions of the candidate (fitted to the site image's aspect ratio) the
+# site image is tried at; 1.0 is "same framing", smaller is "cropped"
+SCALES = (1.0, 0.9, 0.8, 0.7, 0.6)
+
+# Smallest template side worth correlating
+MIN_TEMPLATE = 8
+
+
+def rendition(fpath, budget=MEMORY_BUDGET):
+    """Decode fpath (in draft mode) to a grayscale image at most
+    RENDITION_SIZE on its long side."""
+    img, _w, _h = open_image(fpath, mode="L", budget=budget)
+    img = img.convert("L")
+    img.thumbnail((RENDITION_SIZE, RENDITION_SIZE))
+    return img
+
+
+def _ncc(image, template):
+    """Normalized cross-correlation of template at every offset in image."""
+    th, tw = template.shape
+    n = th * tw
+    t = template - template.mean()
+    t_norm = np.sqrt((t * t).sum())
+    windows = sliding_window_view(image, (th, tw))
+    # t sums to zero, so the window means drop out of the numerator
+    num = np.einsum("ijkl,kl->ij", windows, t)
+    sums = windows.sum(axis=(2, 3))
+    var = np.einsum("ijkl,ijkl->ij", windows, windows) - sums * sums / n
+    den = np.sqrt(np.maximum(var, 0)) * t_norm
+    return np.divide(num, den, out=np.zeros_like(num), where=den > 1e-6)
+
+
+def align_score(site, cand):
+    """Best correlation of the site rendition placed inside the candidate
+    rendition (both PIL "L" images) over SCALES and all offsets.
+
+    Returns (score, scale, x, y), with x, y the template's top-left corner in
+    candidate rendition pixels.
+    """
+    c = np.asarray(cand, dtype=np.float32)
+    ch, cw = c.shape
+    fit = min(cw / site.width, ch / site.height)
+    best = (-1.0, None, None, None)
+    for scale in SCALES:
+        tw = min(cw, round(site.width * fit * scale))
+        th = min(ch, round(site.height * fit * scale))
+        if tw < MIN_TEMPLATE or th < MIN_TEMPLATE:
+            continue
+        t = np.asarray(site.resize((tw, th), Image.Resampling.BILINEAR), dtype=np.float32)
+        scores = _ncc(c, t)
+        y, x = np.unravel_index(np.argmax(scores), scores.shape)
+        if scores[y, x] > best[0]:
+            best = (float(scores[y, x]), scale, int(x), int(y))
+    return best
+
+
+class RenditionCache:
+    """Renditions by path, decoded on first use. Unreadable files give None."""
+
+    def __init__(self, budget=MEMORY_BUDGET):
+        self.budget = budget
+        self.images = {}
+
+    def get(self, fpath):
+        if fpath not in self.images:
+            try:
+                self.images[fpath] = rendition(fpath, self.budget)
+            except Exception:
+                self.images[fpath] = None
+        return self.images[fpath]
@@ -0,0 +1,140 @@
+"""Gitignore-style include/exclude rules for walking candidate directories.
+
+Patterns follow the .gitignore conventions that matter for photo archives:
+
+    *.xmp               any file or directory with that name, at any depth
+    Previews/           directories only
+    /Backups            anchored to the search root (so is any pattern with a /)
+    **/Lightroom/*.lrdata
+    !keep.tif           re-include something an earlier pattern excluded
+
+Excluded directories are pruned from os.walk, so nothing under them is listed.
+"""
+
+import os
+import re
+
+SIZE_UNITS = {"": 1, "k": 1024, "m": 1024 ** 2, "g": 1024 ** 3}
+
+
+def parse_size(text):
+    """Parse a size like 500, 20k, 1.5M or 2G into bytes."""
+    m = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([kmg]?)b?\s*", text.lower())
+    if not m:
+        raise ValueError(f"bad size {text!r}")
+    return int(float(m.group(1)) * SIZE_UNITS[m.group(2)])
+
+
+def _translate(glob):
+    """Translate a gitignore glob into a regex over '/'-separated paths."""
+    out = []
+    i = 0
+    while i < len(glob):
+        c = glob[i]
+        if glob.startswith("**/", i):
+            out.append("(?:.*/)?")
+            i += 3
+            continue
+        if glob.startswith("**", i):
+            out.append(".*")
+            i += 2
+            continue
+        if c == "*":
+            out.append("[^/]*")
+        elif c == "?":
+            out.append("[^/]")
+        elif c == "[":
+            end = glob.find("]", i + 1)
+            if end == -1:
+                out.append(re.escape(c))
+            else:
+                body = glob[i + 1:end]
+                negate = body.startswith("!")
+                if negate:
+                    body = body[1:]
+                # Literal inside a regex class too, e.g. glob_escape()'s [[]
+                body = re.sub(r"([\\\[^&~|])", r"\\\1", body)
+                out.append(f"[{'^' if negate else ''}{body}]")
+                i = end
+        else:
+            out.append(re.escape(c))
+        i += 1
+    return "".join(out)
+
+
+class Rule:
+    def __init__(self, pattern):
+        self.negate = pattern.startswith("!")
+        if self.negate:
+            pattern = pattern[1:]
+        self.dir_only = pattern.endswith("/")
+        pattern = pattern.rstrip("/")
+        anchored = "/" in pattern
+        pattern = pattern.lstrip("/")
+        prefix = "" if anchored else "(?:.*/)?"
+        self.regex = re.compile(prefix + _translate(pattern) + r"\Z")
+
+    def matches(self, relpath, is_dir):
+        if self.dir_only and not is_dir:
+            return False
+        return self.regex.match(relpath) is not None
+
+
+class WalkFilter:
+    """Decide which paths under a root are walked and kept."""
+
+    def __init__(self, patterns=(), min_size=None, max_size=None):
+        self.rules = [Rule(p) for p in patterns]
+        self.min_size = min_size
+        self.max_size = max_size
+
+    @staticmethod
+    def read_ignore_file(path):
+        """Patterns from a .gitignore-style file (blank lines and # comments skipped)."""
+        with open(path) as f:
+            return [line.rstrip("\n") for line in f
+                    if line.strip() and not line.lstrip().startswith("#")]
+
+    def excluded(self, relpath, is_dir=False):
+        """Last matching rule wins, as in .gitignore."""
+        result = False
+        for rule in self.rules:
+            if rule.matches(relpath, is_dir):
+                result = not rule.negate
+        return result
+
+    def size_ok(self, size):
+        if self.min_size is not None and size < self.min_size:
+            return False
+        if self.max_size is not None and size > self.max_size:
+            return False
+        return True
+
+    def walk(self, top, onerror=None):
+        """os.walk(top) that prunes excluded directories and drops excluded files.
+
+        Yields (root, filenames) with filenames sorted; onerror is passed to os.walk.
+        """
+        for root, dirs, files in os.walk(top, onerror=onerror):
+            rel_root = os.path.relpath(root, top).replace(os.sep, "/")
+            rel_root = "" if rel_root == "." else rel_root + "/"
+            dirs[:] = sorted(d for d in dirs if not self.excluded(rel_root + d, is_dir=True))
+            yield root, sorted(f for f in files if not self.excluded(rel_root + f))
+
+
+def exclude_dir_patterns(search_dir, exclude_dirs):
+    """Turn --exclude directory paths into anchored patterns under search_dir.
+
+    Unlike a plain prefix test, /a/Backups doesn't also exclude /a/Backups-old.
+    """
+    patterns = []
+    for ex in exclude_dirs:
+        rel = os.path.relpath(os.path.abspath(ex), search_dir)
+        if rel == "." or rel.startswith(".."):
+            continue
+        patterns.append("/" + glob_escape(rel.replace(os.sep, "/")) + "/")
+    return patterns
+
+
+def glob_escape(text):
+    return re.sub(r"([*?\[])", r"[\1]", text)